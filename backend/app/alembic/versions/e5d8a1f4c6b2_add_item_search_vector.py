@@ -0,0 +1,78 @@
+"""Add item search vector
+
+Revision ID: e5d8a1f4c6b2
+Revises: b7e3f1c2a9d4
+Create Date: 2026-10-18 20:42:51.173604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d8a1f4c6b2'
+down_revision = 'b7e3f1c2a9d4'
+branch_labels = None
+depends_on = None
+
+# Rows updated by each transaction of the backfill
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade():
+    # A generated column would rewrite the table under an ACCESS EXCLUSIVE lock,
+    # a nullable column is added instantly and kept up to date by a trigger
+    op.add_column('item', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute("""
+        CREATE FUNCTION item_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('english', NEW.title), 'A') ||
+                setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER item_search_vector_update
+        BEFORE INSERT OR UPDATE OF title, description ON item
+        FOR EACH ROW EXECUTE FUNCTION item_search_vector_update()
+    """)
+
+    # The existing items are filled in by the trigger, in batches of their own
+    # transaction so that only a few rows are locked at a time
+    backfill = sa.text("""
+        WITH batch AS (
+            SELECT id FROM item WHERE id > :after ORDER BY id LIMIT :size
+        )
+        UPDATE item SET title = item.title FROM batch WHERE item.id = batch.id
+        RETURNING item.id
+    """)
+    with op.get_context().autocommit_block():
+        after = '00000000-0000-0000-0000-000000000000'
+        while ids := op.get_bind().execute(backfill, {'after': after, 'size': BACKFILL_BATCH_SIZE}).scalars().all():
+            after = max(ids)
+        # CREATE INDEX CONCURRENTLY doesn't block writes but can't run in a transaction
+        op.create_index(
+            'ix_item_search_vector',
+            'item',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_item_search_vector',
+            table_name='item',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.execute("DROP TRIGGER item_search_vector_update ON item")
+    op.execute("DROP FUNCTION item_search_vector_update()")
+    op.drop_column('item', 'search_vector')
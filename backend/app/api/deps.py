@@ -1,17 +1,27 @@
-from collections.abc import Generator
+import math
+import uuid
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
-import jwt
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import async_engine, engine, replicas
+from app.core.rate_limit import (
+    LOGIN_PER_ACCOUNT,
+    LOGIN_PER_IP,
+    PASSWORD_RECOVERY_PER_ACCOUNT,
+    PASSWORD_RECOVERY_PER_IP,
+    RateLimit,
+    get_rate_limit_backend,
+)
+from app.models import TokenPayload, User, UserPublic
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -23,35 +33,151 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Expired attributes can't be lazy loaded without awaiting, keep them loaded
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+def get_read_db() -> Generator[Session, None, None]:
+    with Session(replicas.get_engine()) as session:
+        yield session
+
+
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(
+        replicas.get_async_engine(), expire_on_commit=False
+    ) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+# Session of a read replica when there is a healthy one, for the reads of GET
+# routes that may lag behind the latest writes. Writes and the reads that must
+# see them, like the current user, use the session of the primary
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def get_token_user_id(token: str) -> uuid.UUID:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-    except (InvalidTokenError, ValidationError):
+        token_data = TokenPayload(**security.decode_token(token))
+        return uuid.UUID(token_data.sub)
+    except (InvalidTokenError, ValidationError, TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+
+
+def cache_principal(user: User | None) -> UserPublic:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if not user.is_active:
+    principal = UserPublic.model_validate(user)
+    security.authenticated_user_cache.set(user.id, principal)
+    return principal
+
+
+def check_active(principal: UserPublic) -> UserPublic:
+    if not principal.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
+
+def get_current_principal(session: SessionDep, token: TokenDep) -> UserPublic:
+    # The session only connects to the database on a cache miss
+    user_id = get_token_user_id(token)
+    principal = security.authenticated_user_cache.get(user_id)
+    if principal is None:
+        principal = cache_principal(session.get(User, user_id))
+    return check_active(principal)
+
+
+async def get_current_principal_async(
+    session: AsyncSessionDep, token: TokenDep
+) -> UserPublic:
+    user_id = get_token_user_id(token)
+    principal = security.authenticated_user_cache.get(user_id)
+    if principal is None:
+        principal = cache_principal(await session.get(User, user_id))
+    return check_active(principal)
+
+
+# The authenticated user, without the fields that aren't public, use it when the
+# full database row is not needed, most requests won't query the database then
+CurrentPrincipal = Annotated[UserPublic, Depends(get_current_principal)]
+AsyncCurrentPrincipal = Annotated[UserPublic, Depends(get_current_principal_async)]
+
+
+def get_current_user(session: SessionDep, principal: CurrentPrincipal) -> User:
+    user = session.get(User, principal.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+async def get_current_user_async(
+    session: AsyncSessionDep, principal: AsyncCurrentPrincipal
+) -> User:
+    user = await session.get(User, principal.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
 CurrentUser = Annotated[User, Depends(get_current_user)]
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
-    if not current_user.is_superuser:
+def check_superuser(principal: UserPublic) -> UserPublic:
+    if not principal.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
-    return current_user
+    return principal
+
+
+def get_current_active_superuser(principal: CurrentPrincipal) -> UserPublic:
+    return check_superuser(principal)
+
+
+async def get_current_active_superuser_async(
+    principal: AsyncCurrentPrincipal,
+) -> UserPublic:
+    return check_superuser(principal)
+
+
+def check_rate_limit(limit: RateLimit, key: str) -> None:
+    backend = get_rate_limit_backend()
+    if backend is None:
+        return
+    wait = backend.acquire(f"{limit.name}:{key}", limit)
+    if wait > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+def get_client_ip(request: Request) -> str:
+    # The server replaces the client with the IP forwarded by trusted proxies,
+    # see FORWARDED_ALLOW_IPS in scripts/start.sh and docker-compose.yml
+    return request.client.host if request.client else "unknown"
+
+
+# Run as dependencies of the routes, before the passwords are hashed or the
+# emails queued. The IP is checked first, so that requests rejected for their IP
+# don't use the tokens of the account
+def limit_login(
+    request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+) -> None:
+    check_rate_limit(LOGIN_PER_IP, get_client_ip(request))
+    check_rate_limit(LOGIN_PER_ACCOUNT, form_data.username.lower())
+
+
+def limit_password_recovery(request: Request, email: str) -> None:
+    check_rate_limit(PASSWORD_RECOVERY_PER_IP, get_client_ip(request))
+    check_rate_limit(PASSWORD_RECOVERY_PER_ACCOUNT, email.lower())
@@ -0,0 +1,66 @@
+import hashlib
+import uuid
+from collections.abc import Iterable
+from typing import Annotated
+
+from fastapi import Header, HTTPException, Response
+
+from app.core.compression import strip_etag_coding
+
+IfNoneMatch = Annotated[
+    str | None,
+    Header(description="ETags of the representations the client has cached"),
+]
+IfMatch = Annotated[
+    str | None,
+    Header(description="Only update the resource if its ETag is one of these"),
+]
+
+
+def row_etag(id: uuid.UUID, version: int) -> str:
+    # The version of a row changes with every update of it
+    return f'"{id.hex}-{version}"'
+
+
+def page_etag(rows: Iterable[tuple[uuid.UUID, int]], *extra: object) -> str:
+    """
+    ETag of a list of rows, given the id and version of each one and any other
+    value of the response, like its total count.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for id, version in rows:
+        digest.update(id.bytes)
+        digest.update(version.to_bytes(8, "big"))
+    digest.update(repr(extra).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def parse_etags(header: str) -> list[str]:
+    # The compressed representations of a response validate like the response
+    return [strip_etag_coding(tag.strip()) for tag in header.split(",")]
+
+
+def is_not_modified(if_none_match: str | None, etag: str) -> bool:
+    """
+    Whether the client already has the representation of the ETag, comparing
+    weakly as required for If-None-Match.
+    """
+    if if_none_match is None:
+        return False
+    tags = parse_etags(if_none_match)
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def check_if_match(if_match: str | None, etag: str) -> None:
+    # Weak ETags never match strongly
+    if if_match is None:
+        return
+    tags = parse_etags(if_match)
+    if "*" not in tags and etag not in tags:
+        raise HTTPException(
+            status_code=412, detail="The resource was modified since it was read"
+        )
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+import uuid
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row, Select
+from sqlmodel import Session, col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.db import async_engine, engine
+from app.models import Item, ItemExportFormat
+
+# Rows fetched from the server-side cursor, and written to the response, at once
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = ("id", "title", "description", "owner_id")
+
+EXPORT_MEDIA_TYPES: dict[ItemExportFormat, str] = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def export_statement(owner_id: uuid.UUID | None) -> Select[Any]:
+    statement = select(Item.id, Item.title, Item.description, Item.owner_id)
+    if owner_id is not None:
+        statement = statement.where(Item.owner_id == owner_id)
+    # yield_per streams the rows with a server-side cursor instead of loading
+    # them all in memory
+    return statement.order_by(col(Item.id)).execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+
+
+def serialize_rows(rows: Sequence[Row[Any]], format: ItemExportFormat) -> str:
+    if format == "ndjson":
+        return "".join(
+            json.dumps(
+                {
+                    "id": str(id),
+                    "title": title,
+                    "description": description,
+                    "owner_id": str(owner_id),
+                }
+            )
+            + "\n"
+            for id, title, description, owner_id in rows
+        )
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def serialize_header(format: ItemExportFormat) -> str:
+    if format == "ndjson":
+        return ""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_COLUMNS)
+    return buffer.getvalue()
+
+
+def stream_items(owner_id: uuid.UUID | None, format: ItemExportFormat) -> Iterator[str]:
+    # The request session is closed before the response is streamed, use our own
+    yield serialize_header(format)
+    with Session(engine) as session:
+        result = session.execute(export_statement(owner_id))
+        for rows in result.partitions():
+            yield serialize_rows(rows, format)
+
+
+async def stream_items_async(
+    owner_id: uuid.UUID | None, format: ItemExportFormat
+) -> AsyncIterator[str]:
+    yield serialize_header(format)
+    async with AsyncSession(async_engine) as session:
+        result = await session.stream(export_statement(owner_id))
+        async for rows in result.partitions():
+            yield serialize_rows(rows, format)
+
+
+def export_response(
+    content: Iterator[str] | AsyncIterator[str], format: ItemExportFormat
+) -> StreamingResponse:
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="items.{format}"'},
+    )
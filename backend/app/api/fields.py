@@ -0,0 +1,80 @@
+from collections.abc import Iterable, Sequence
+from typing import Annotated, Any, TypeVar
+
+from fastapi import Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import Row, Select, select
+from sqlmodel import SQLModel
+
+from app.models import ItemPublic, UserPublic
+
+FieldsQuery = Annotated[
+    str | None,
+    Query(
+        description="Comma separated fields to return for each row, all of them "
+        "when not given"
+    ),
+]
+
+
+def parse_fields(fields: str | None, model: type[BaseModel]) -> list[str] | None:
+    """
+    Names of the fields of the model requested in a `fields` parameter, in the
+    order of the model.
+    """
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",")} - {""}
+    unknown = names - model.model_fields.keys()
+    if not names or unknown:
+        invalid = ", ".join(sorted(unknown)) if unknown else repr(fields)
+        raise HTTPException(status_code=400, detail=f"Invalid fields: {invalid}")
+    return [name for name in model.model_fields if name in names]
+
+
+def get_item_fields(fields: FieldsQuery = None) -> list[str] | None:
+    return parse_fields(fields, ItemPublic)
+
+
+def get_user_fields(fields: FieldsQuery = None) -> list[str] | None:
+    return parse_fields(fields, UserPublic)
+
+
+ItemFieldsDep = Annotated[list[str] | None, Depends(get_item_fields)]
+UserFieldsDep = Annotated[list[str] | None, Depends(get_user_fields)]
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def select_fields(
+    statement: Select[Any],
+    table_model: type[SQLModel],
+    fields: Iterable[str],
+    *required: str,
+) -> Select[Any]:
+    """
+    Select the columns of the fields, and of the required ones like the key of
+    the pagination, of the rows of a statement of model instances, filtered by
+    its WHERE clause.
+
+    The statement selects plain rows, unlike `select()` of SQLModel whose
+    statements `exec()` turns into scalars.
+    """
+    table = table_model.__table__  # type: ignore[attr-defined]
+    names = dict.fromkeys([*fields, *required])
+    narrowed = select(*(table.c[name] for name in names))
+    if statement.whereclause is not None:
+        narrowed = narrowed.where(statement.whereclause)
+    return narrowed
+
+
+def construct_models(model: type[ModelT], rows: Sequence[Row[Any]]) -> list[ModelT]:
+    # The rows come from the database, they are not validated again
+    return [model.model_construct(**row._mapping) for row in rows]
+
+
+def page_include(fields: list[str] | None) -> dict[str, Any] | None:
+    # The fields of the rows of a page to send
+    if fields is None:
+        return None
+    return {"data": {"__all__": set(fields)}, "count": True, "next_cursor": True}
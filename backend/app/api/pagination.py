@@ -0,0 +1,140 @@
+import base64
+import binascii
+import struct
+import uuid
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Annotated, Any, TypeVar
+
+import sqlalchemy
+from fastapi import Depends, HTTPException
+from sqlalchemy import ColumnElement, and_, or_
+from sqlmodel.sql.expression import Select
+
+from app.core.config import settings
+from app.models import CountMode
+
+T = TypeVar("T")
+# Statements of model instances, or of rows of some of their columns
+StatementT = TypeVar("StatementT", bound=sqlalchemy.Select[Any])
+
+
+# Rank of a row, as a big-endian double, followed by its key
+RANKED_CURSOR = struct.Struct(">d16s")
+
+
+def encode_cursor_bytes(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor_bytes(cursor: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_cursor(key: uuid.UUID) -> str:
+    return encode_cursor_bytes(key.bytes)
+
+
+def decode_cursor(cursor: str) -> uuid.UUID:
+    try:
+        return uuid.UUID(bytes=decode_cursor_bytes(cursor))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_ranked_cursor(rank: float, key: uuid.UUID) -> str:
+    return encode_cursor_bytes(RANKED_CURSOR.pack(rank, key.bytes))
+
+
+def decode_ranked_cursor(cursor: str) -> tuple[float, uuid.UUID]:
+    try:
+        rank, key = RANKED_CURSOR.unpack(decode_cursor_bytes(cursor))
+    except struct.error:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return rank, uuid.UUID(bytes=key)
+
+
+@dataclass
+class Pagination:
+    """
+    Offset or keyset pagination of a statement ordered by a unique key.
+
+    Keyset pagination is used when a cursor is given: rows are fetched after the
+    key encoded in the cursor using the key index, so deep pages are as fast as
+    the first one, and skip is ignored.
+    """
+
+    skip: int
+    limit: int
+    after: uuid.UUID | None
+
+    def apply(self, statement: StatementT, key: Any) -> StatementT:
+        statement = statement.order_by(key).limit(self.limit)
+        if self.after is not None:
+            return statement.where(key > self.after)
+        return statement.offset(self.skip)
+
+    def next_cursor(self, rows: Sequence[Any]) -> str | None:
+        if not rows or len(rows) < self.limit:
+            return None
+        return encode_cursor(rows[-1].id)
+
+
+@dataclass
+class RankedPagination:
+    """
+    Offset or keyset pagination of a statement ordered by a rank, highest first,
+    then by a unique key.
+
+    Cursors hold the rank and the key of the last row of a page, ranks must be
+    computed the same way for every page.
+    """
+
+    skip: int
+    limit: int
+    after: tuple[float, uuid.UUID] | None
+
+    def apply(
+        self, statement: Select[tuple[T, float]], rank: ColumnElement[float], key: Any
+    ) -> Select[tuple[T, float]]:
+        statement = statement.order_by(rank.desc(), key).limit(self.limit)
+        if self.after is not None:
+            after_rank, after_key = self.after
+            return statement.where(
+                or_(rank < after_rank, and_(rank == after_rank, key > after_key))
+            )
+        return statement.offset(self.skip)
+
+    def next_cursor(self, rows: Sequence[tuple[Any, float]]) -> str | None:
+        if not rows or len(rows) < self.limit:
+            return None
+        row, rank = rows[-1]
+        return encode_ranked_cursor(rank, row.id)
+
+
+def get_pagination(
+    skip: int = 0, limit: int = 100, cursor: str | None = None
+) -> Pagination:
+    after = decode_cursor(cursor) if cursor else None
+    return Pagination(skip=skip, limit=limit, after=after)
+
+
+def get_ranked_pagination(
+    skip: int = 0, limit: int = 100, cursor: str | None = None
+) -> RankedPagination:
+    after = decode_ranked_cursor(cursor) if cursor else None
+    return RankedPagination(skip=skip, limit=limit, after=after)
+
+
+PaginationDep = Annotated[Pagination, Depends(get_pagination)]
+RankedPaginationDep = Annotated[RankedPagination, Depends(get_ranked_pagination)]
+
+
+def get_count_mode(count: CountMode | None = None) -> CountMode:
+    return count or settings.COUNT_MODE
+
+
+CountModeDep = Annotated[CountMode, Depends(get_count_mode)]
@@ -0,0 +1,46 @@
+from typing import Any
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic.main import IncEx
+
+from app.core.config import settings
+
+
+class ModelResponse(Response):
+    """
+    JSON response rendered straight from a pydantic model by pydantic-core.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self, content: BaseModel, *, include: IncEx | None = None, **kwargs: Any
+    ) -> None:
+        # Used by render, which runs in Response.__init__
+        self.include = include
+        super().__init__(content, **kwargs)
+
+    def render(self, content: BaseModel) -> bytes:
+        return content.__pydantic_serializer__.to_json(content, include=self.include)
+
+
+def model_response(
+    model: BaseModel, response: Response | None = None, *, include: IncEx | None = None
+) -> Any:
+    """
+    Return the model from a route as JSON.
+
+    FastAPI validates the value returned by a route against its response model,
+    serializes it to Python objects and encodes them with json, a response
+    skips all of it. The model must be the response model of the route, it's
+    sent as is. Headers set on the `response` parameter of the route are kept.
+
+    Only the fields in `include` are sent when it's given, as this doesn't match
+    the response model the response is then always rendered here.
+    """
+    if settings.FAST_JSON_RESPONSES or include is not None:
+        # FastAPI only adds them to the responses it renders itself
+        headers = dict(response.headers) if response is not None else None
+        return ModelResponse(model, include=include, headers=headers)
+    return model
@@ -1,109 +1,337 @@
 import uuid
-from typing import Any
+from collections.abc import Sequence
+from typing import Annotated, Any
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+import sqlalchemy
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import col, select
+from sqlmodel.sql.expression import Select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
+from app import crud
+from app.api.deps import CurrentPrincipal, ReadSessionDep, SessionDep
+from app.api.etags import (
+    IfMatch,
+    IfNoneMatch,
+    check_if_match,
+    is_not_modified,
+    not_modified,
+    page_etag,
+    row_etag,
+)
+from app.api.export import export_response, stream_items
+from app.api.fields import (
+    ItemFieldsDep,
+    construct_models,
+    page_include,
+    select_fields,
+)
+from app.api.pagination import (
+    CountModeDep,
+    Pagination,
+    PaginationDep,
+    RankedPagination,
+    RankedPaginationDep,
+)
+from app.api.responses import model_response
+from app.models import (
+    Item,
+    ItemCreate,
+    ItemExportFormat,
+    ItemPublic,
+    ItemsBatchCreate,
+    ItemsBatchDelete,
+    ItemsBatchResults,
+    ItemsBatchUpdate,
+    ItemsPublic,
+    ItemUpdate,
+    Message,
+    UserPublic,
+)
 
 router = APIRouter(prefix="/items", tags=["items"])
 
+# The route bodies are shared with app.api.routes.items_async, only the session
+# calls differ
+
+
+def get_owner_id(current_user: UserPublic) -> uuid.UUID | None:
+    # Superusers see the items of every user
+    return None if current_user.is_superuser else current_user.id
+
+
+def read_items_statement(
+    owner_id: uuid.UUID | None, pagination: Pagination, fields: list[str] | None
+) -> sqlalchemy.Select[Any]:
+    # Statement of items, or of rows of some of their columns
+    statement = select(Item)
+    if owner_id is not None:
+        statement = statement.where(Item.owner_id == owner_id)
+    if fields is None:
+        return pagination.apply(statement, col(Item.id))
+    # The id and the version are needed for the cursor and the ETag
+    return pagination.apply(
+        select_fields(statement, Item, fields, "id", "version"), col(Item.id)
+    )
+
+
+def items_page_response(
+    rows: Sequence[Any],
+    count: int | None,
+    pagination: Pagination,
+    fields: list[str] | None,
+    response: Response,
+    if_none_match: str | None,
+) -> Any:
+    items: Sequence[Item | ItemPublic]
+    items = rows if fields is None else construct_models(ItemPublic, rows)
+    next_cursor = pagination.next_cursor(items)
+    etag = page_etag(
+        ((item.id, item.version) for item in items), count, next_cursor, fields
+    )
+    if is_not_modified(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return model_response(
+        ItemsPublic(data=items, count=count, next_cursor=next_cursor),
+        response,
+        include=page_include(fields),
+    )
+
+
+def search_items_statement(
+    q: str, owner_id: uuid.UUID | None, pagination: RankedPagination
+) -> Select[tuple[Item, float]]:
+    rank = crud.item_search_rank(q)
+    statement = select(Item, rank).where(crud.item_search_match(q))
+    if owner_id is not None:
+        statement = statement.where(Item.owner_id == owner_id)
+    return pagination.apply(statement, rank, col(Item.id))
+
+
+def search_page_response(
+    rows: Sequence[tuple[Item, float]],
+    count: int | None,
+    pagination: RankedPagination,
+    response: Response,
+    if_none_match: str | None,
+) -> Any:
+    next_cursor = pagination.next_cursor(rows)
+    items = [item for item, _ in rows]
+    etag = page_etag(((item.id, item.version) for item in items), count, next_cursor)
+    if is_not_modified(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return model_response(
+        ItemsPublic(data=items, count=count, next_cursor=next_cursor), response
+    )
+
+
+def item_version_statement(id: uuid.UUID) -> Select[tuple[uuid.UUID, int]]:
+    return select(Item.owner_id, Item.version).where(Item.id == id)
+
+
+def item_not_modified(
+    row: tuple[uuid.UUID, int] | None,
+    id: uuid.UUID,
+    current_user: UserPublic,
+    if_none_match: str | None,
+) -> Response | None:
+    # A 304 response when the client has the version of the row, given its owner
+    # and version, and is allowed to read it
+    if row is None:
+        return None
+    owner_id, version = row
+    etag = row_etag(id, version)
+    allowed = current_user.is_superuser or owner_id == current_user.id
+    if allowed and is_not_modified(if_none_match, etag):
+        return not_modified(etag)
+    return None
+
+
+def check_item_access(item: Item | None, current_user: UserPublic) -> Item:
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    if not current_user.is_superuser and (item.owner_id != current_user.id):
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    return item
+
 
 @router.get("/", response_model=ItemsPublic)
 def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    pagination: PaginationDep,
+    count_mode: CountModeDep,
+    fields: ItemFieldsDep,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
 ) -> Any:
     """
     Retrieve items.
+
+    Pass the `next_cursor` of a page as `cursor` to get the next one, this is
+    faster than `skip` for deep pages. Use `count` to choose how the total is
+    computed, `estimated` and `none` are cheaper than `exact` on large tables.
+    The page is not sent again when its ETag is passed in `If-None-Match`.
+    Pass `fields` to only read and send some fields of the items, like
+    `fields=id,title`.
+    """
+
+    owner_id = get_owner_id(current_user)
+    count = crud.count_items(session=session, owner_id=owner_id, mode=count_mode)
+    statement = read_items_statement(owner_id, pagination, fields)
+    rows = session.exec(statement).all()  # type: ignore[call-overload]
+    return items_page_response(rows, count, pagination, fields, response, if_none_match)
+
+
+@router.get("/search", response_model=ItemsPublic)
+def search_items(
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    q: Annotated[str, Query(min_length=1, description="Words to search for")],
+    pagination: RankedPaginationDep,
+    count_mode: CountModeDep,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
+) -> Any:
+    """
+    Search items by their title and description.
+
+    The query accepts the syntax of web search engines: quoted phrases, `or`
+    and `-` to exclude a word. Items are ranked by relevance, matches in the
+    title first, and paginated like the list of items.
     """
+    owner_id = get_owner_id(current_user)
+    count = crud.count_search_items(
+        session=session, q=q, owner_id=owner_id, mode=count_mode
+    )
+    statement = search_items_statement(q, owner_id, pagination)
+    rows = session.exec(statement).all()
+    return search_page_response(rows, count, pagination, response, if_none_match)
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
-    else:
-        count_statement = (
-            select(func.count())
-            .select_from(Item)
-            .where(Item.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Item)
-            .where(Item.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        items = session.exec(statement).all()
-
-    return ItemsPublic(data=items, count=count)
+
+@router.get("/export", response_class=StreamingResponse)
+def export_items(
+    current_user: CurrentPrincipal, format: ItemExportFormat = "ndjson"
+) -> Any:
+    """
+    Export all the items as NDJSON or CSV.
+
+    The items are streamed as they are read from the database, in id order.
+    """
+    return export_response(stream_items(get_owner_id(current_user), format), format)
+
+
+@router.post("/batch", response_model=ItemsBatchResults)
+def create_items(
+    *, session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsBatchCreate
+) -> Any:
+    """
+    Create many items in one transaction.
+    """
+    results = crud.create_items(
+        session=session, items_in=items_in.data, owner_id=current_user.id
+    )
+    return ItemsBatchResults(data=results)
+
+
+@router.patch("/batch", response_model=ItemsBatchResults)
+def update_items(
+    *, session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsBatchUpdate
+) -> Any:
+    """
+    Update many items in one transaction.
+
+    Items that don't exist or can't be updated are skipped and reported in the
+    result of their row.
+    """
+    results = crud.update_items(
+        session=session, items_in=items_in.data, owner_id=get_owner_id(current_user)
+    )
+    return ItemsBatchResults(data=results)
+
+
+@router.delete("/batch", response_model=ItemsBatchResults)
+def delete_items(
+    *, session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsBatchDelete
+) -> Any:
+    """
+    Delete many items in one transaction.
+
+    Items that don't exist or can't be deleted are skipped and reported in the
+    result of their row.
+    """
+    results = crud.delete_items(
+        session=session, ids=items_in.ids, owner_id=get_owner_id(current_user)
+    )
+    return ItemsBatchResults(data=results)
 
 
 @router.get("/{id}", response_model=ItemPublic)
-def read_item(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+def read_item(
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    id: uuid.UUID,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
+) -> Any:
     """
     Get item by ID.
+
+    The item is not sent again when its ETag is passed in `If-None-Match`.
     """
-    item = session.get(Item, id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    return item
+    if if_none_match is not None:
+        # Compare with the version of the row before loading all of it
+        row = session.exec(item_version_statement(id)).first()
+        cached = item_not_modified(row, id, current_user, if_none_match)
+        if cached is not None:
+            return cached
+    item = check_item_access(session.get(Item, id), current_user)
+    response.headers["ETag"] = row_etag(item.id, item.version)
+    return model_response(ItemPublic.model_validate(item), response)
 
 
 @router.post("/", response_model=ItemPublic)
 def create_item(
-    *, session: SessionDep, current_user: CurrentUser, item_in: ItemCreate
+    *, session: SessionDep, current_user: CurrentPrincipal, item_in: ItemCreate
 ) -> Any:
     """
     Create new item.
     """
-    item = Item.model_validate(item_in, update={"owner_id": current_user.id})
-    session.add(item)
-    session.commit()
-    session.refresh(item)
-    return item
+    return crud.create_item(session=session, item_in=item_in, owner_id=current_user.id)
 
 
 @router.put("/{id}", response_model=ItemPublic)
 def update_item(
     *,
     session: SessionDep,
-    current_user: CurrentUser,
+    current_user: CurrentPrincipal,
     id: uuid.UUID,
     item_in: ItemUpdate,
+    response: Response,
+    if_match: IfMatch = None,
 ) -> Any:
     """
     Update an item.
+
+    Pass the ETag of the item in `If-Match` to only update it if it wasn't
+    modified since it was read.
     """
-    item = session.get(Item, id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    update_dict = item_in.model_dump(exclude_unset=True)
-    item.sqlmodel_update(update_dict)
-    session.add(item)
-    session.commit()
-    session.refresh(item)
+    item = check_item_access(session.get(Item, id), current_user)
+    check_if_match(if_match, row_etag(item.id, item.version))
+    item = crud.update_item(session=session, db_item=item, item_in=item_in)
+    response.headers["ETag"] = row_etag(item.id, item.version)
     return item
 
 
 @router.delete("/{id}")
 def delete_item(
-    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+    session: SessionDep, current_user: CurrentPrincipal, id: uuid.UUID
 ) -> Message:
     """
     Delete an item.
     """
-    item = session.get(Item, id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(item)
-    session.commit()
+    item = check_item_access(session.get(Item, id), current_user)
+    crud.delete_item(session=session, db_item=item)
     return Message(message="Item deleted successfully")
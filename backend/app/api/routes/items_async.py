@@ -0,0 +1,238 @@
+import uuid
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Query, Response
+from fastapi.responses import StreamingResponse
+
+from app import crud_async
+from app.api.deps import AsyncCurrentPrincipal, AsyncReadSessionDep, AsyncSessionDep
+from app.api.etags import IfMatch, IfNoneMatch, check_if_match, row_etag
+from app.api.export import export_response, stream_items_async
+from app.api.fields import ItemFieldsDep
+from app.api.pagination import CountModeDep, PaginationDep, RankedPaginationDep
+from app.api.responses import model_response
+from app.api.routes.items import (
+    check_item_access,
+    get_owner_id,
+    item_not_modified,
+    item_version_statement,
+    items_page_response,
+    read_items_statement,
+    search_items_statement,
+    search_page_response,
+)
+from app.models import (
+    Item,
+    ItemCreate,
+    ItemExportFormat,
+    ItemPublic,
+    ItemsBatchCreate,
+    ItemsBatchDelete,
+    ItemsBatchResults,
+    ItemsBatchUpdate,
+    ItemsPublic,
+    ItemUpdate,
+    Message,
+)
+
+# Async version of app.api.routes.items, used when settings.USE_ASYNC_DB is set
+
+router = APIRouter(prefix="/items", tags=["items"])
+
+
+@router.get("/", response_model=ItemsPublic)
+async def read_items(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    pagination: PaginationDep,
+    count_mode: CountModeDep,
+    fields: ItemFieldsDep,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
+) -> Any:
+    """
+    Retrieve items.
+
+    Pass the `next_cursor` of a page as `cursor` to get the next one, this is
+    faster than `skip` for deep pages. Use `count` to choose how the total is
+    computed, `estimated` and `none` are cheaper than `exact` on large tables.
+    The page is not sent again when its ETag is passed in `If-None-Match`.
+    Pass `fields` to only read and send some fields of the items, like
+    `fields=id,title`.
+    """
+
+    owner_id = get_owner_id(current_user)
+    count = await crud_async.count_items(
+        session=session, owner_id=owner_id, mode=count_mode
+    )
+    statement = read_items_statement(owner_id, pagination, fields)
+    rows = (await session.exec(statement)).all()  # type: ignore[call-overload]
+    return items_page_response(rows, count, pagination, fields, response, if_none_match)
+
+
+@router.get("/search", response_model=ItemsPublic)
+async def search_items(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    q: Annotated[str, Query(min_length=1, description="Words to search for")],
+    pagination: RankedPaginationDep,
+    count_mode: CountModeDep,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
+) -> Any:
+    """
+    Search items by their title and description.
+
+    The query accepts the syntax of web search engines: quoted phrases, `or`
+    and `-` to exclude a word. Items are ranked by relevance, matches in the
+    title first, and paginated like the list of items.
+    """
+    owner_id = get_owner_id(current_user)
+    count = await crud_async.count_search_items(
+        session=session, q=q, owner_id=owner_id, mode=count_mode
+    )
+    statement = search_items_statement(q, owner_id, pagination)
+    rows = (await session.exec(statement)).all()
+    return search_page_response(rows, count, pagination, response, if_none_match)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_items(
+    current_user: AsyncCurrentPrincipal, format: ItemExportFormat = "ndjson"
+) -> Any:
+    """
+    Export all the items as NDJSON or CSV.
+
+    The items are streamed as they are read from the database, in id order.
+    """
+    return export_response(
+        stream_items_async(get_owner_id(current_user), format), format
+    )
+
+
+@router.post("/batch", response_model=ItemsBatchResults)
+async def create_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    items_in: ItemsBatchCreate,
+) -> Any:
+    """
+    Create many items in one transaction.
+    """
+    results = await crud_async.create_items(
+        session=session, items_in=items_in.data, owner_id=current_user.id
+    )
+    return ItemsBatchResults(data=results)
+
+
+@router.patch("/batch", response_model=ItemsBatchResults)
+async def update_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    items_in: ItemsBatchUpdate,
+) -> Any:
+    """
+    Update many items in one transaction.
+
+    Items that don't exist or can't be updated are skipped and reported in the
+    result of their row.
+    """
+    results = await crud_async.update_items(
+        session=session, items_in=items_in.data, owner_id=get_owner_id(current_user)
+    )
+    return ItemsBatchResults(data=results)
+
+
+@router.delete("/batch", response_model=ItemsBatchResults)
+async def delete_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    items_in: ItemsBatchDelete,
+) -> Any:
+    """
+    Delete many items in one transaction.
+
+    Items that don't exist or can't be deleted are skipped and reported in the
+    result of their row.
+    """
+    results = await crud_async.delete_items(
+        session=session, ids=items_in.ids, owner_id=get_owner_id(current_user)
+    )
+    return ItemsBatchResults(data=results)
+
+
+@router.get("/{id}", response_model=ItemPublic)
+async def read_item(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    id: uuid.UUID,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
+) -> Any:
+    """
+    Get item by ID.
+
+    The item is not sent again when its ETag is passed in `If-None-Match`.
+    """
+    if if_none_match is not None:
+        # Compare with the version of the row before loading all of it
+        row = (await session.exec(item_version_statement(id))).first()
+        cached = item_not_modified(row, id, current_user, if_none_match)
+        if cached is not None:
+            return cached
+    item = check_item_access(await session.get(Item, id), current_user)
+    response.headers["ETag"] = row_etag(item.id, item.version)
+    return model_response(ItemPublic.model_validate(item), response)
+
+
+@router.post("/", response_model=ItemPublic)
+async def create_item(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    item_in: ItemCreate,
+) -> Any:
+    """
+    Create new item.
+    """
+    return await crud_async.create_item(
+        session=session, item_in=item_in, owner_id=current_user.id
+    )
+
+
+@router.put("/{id}", response_model=ItemPublic)
+async def update_item(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    id: uuid.UUID,
+    item_in: ItemUpdate,
+    response: Response,
+    if_match: IfMatch = None,
+) -> Any:
+    """
+    Update an item.
+
+    Pass the ETag of the item in `If-Match` to only update it if it wasn't
+    modified since it was read.
+    """
+    item = check_item_access(await session.get(Item, id), current_user)
+    check_if_match(if_match, row_etag(item.id, item.version))
+    item = await crud_async.update_item(session=session, db_item=item, item_in=item_in)
+    response.headers["ETag"] = row_etag(item.id, item.version)
+    return item
+
+
+@router.delete("/{id}")
+async def delete_item(
+    session: AsyncSessionDep, current_user: AsyncCurrentPrincipal, id: uuid.UUID
+) -> Message:
+    """
+    Delete an item.
+    """
+    item = check_item_access(await session.get(Item, id), current_user)
+    await crud_async.delete_item(session=session, db_item=item)
+    return Message(message="Item deleted successfully")
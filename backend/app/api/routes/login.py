@@ -6,31 +6,30 @@ from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    CurrentPrincipal,
+    SessionDep,
+    get_current_active_superuser,
+    limit_login,
+    limit_password_recovery,
+)
 from app.core import security
 from app.core.config import settings
-from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app.models import Message, NewPassword, Token, User, UserPublic
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
-    send_email,
+    queue_reset_password_email,
     verify_password_reset_token,
 )
 
 router = APIRouter(tags=["login"])
 
+# The route bodies are shared with app.api.routes.login_async, only the session
+# calls differ
 
-@router.post("/login/access-token")
-def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
-) -> Token:
-    """
-    OAuth2 compatible token login, get an access token for future requests
-    """
-    user = crud.authenticate(
-        session=session, email=form_data.username, password=form_data.password
-    )
+
+def access_token_response(user: User | None) -> Token:
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
@@ -43,35 +42,69 @@ def login_access_token(
     )
 
 
-@router.post("/login/test-token", response_model=UserPublic)
-def test_token(current_user: CurrentUser) -> Any:
-    """
-    Test access token
-    """
-    return current_user
+def check_recovery_user(user: User | None) -> User:
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this email does not exist in the system.",
+        )
+    return user
 
 
-@router.post("/password-recovery/{email}")
-def recover_password(email: str, session: SessionDep) -> Message:
-    """
-    Password Recovery
-    """
-    user = crud.get_user_by_email(session=session, email=email)
+def check_reset_token(token: str) -> str:
+    email = verify_password_reset_token(token=token)
+    if not email:
+        raise HTTPException(status_code=400, detail="Invalid token")
+    return email
 
+
+def password_recovery_html_response(user: User | None, email: str) -> HTMLResponse:
     if not user:
         raise HTTPException(
             status_code=404,
-            detail="The user with this email does not exist in the system.",
+            detail="The user with this username does not exist in the system.",
         )
     password_reset_token = generate_password_reset_token(email=email)
     email_data = generate_reset_password_email(
         email_to=user.email, email=email, token=password_reset_token
     )
-    send_email(
-        email_to=user.email,
-        subject=email_data.subject,
-        html_content=email_data.html_content,
+
+    return HTMLResponse(
+        content=email_data.html_content, headers={"subject:": email_data.subject}
     )
+
+
+@router.post("/login/access-token", dependencies=[Depends(limit_login)])
+def login_access_token(
+    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+) -> Token:
+    """
+    OAuth2 compatible token login, get an access token for future requests
+    """
+    user = crud.authenticate(
+        session=session, email=form_data.username, password=form_data.password
+    )
+    return access_token_response(user)
+
+
+@router.post("/login/test-token", response_model=UserPublic)
+def test_token(current_user: CurrentPrincipal) -> Any:
+    """
+    Test access token
+    """
+    return current_user
+
+
+@router.post(
+    "/password-recovery/{email}", dependencies=[Depends(limit_password_recovery)]
+)
+def recover_password(email: str, session: SessionDep) -> Message:
+    """
+    Password Recovery
+    """
+    user = check_recovery_user(crud.get_user_by_email(session=session, email=email))
+    queue_reset_password_email(session=session, email_to=user.email, email=email)
+    session.commit()
     return Message(message="Password recovery email sent")
 
 
@@ -80,21 +113,11 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
     """
     Reset password
     """
-    email = verify_password_reset_token(token=body.token)
-    if not email:
-        raise HTTPException(status_code=400, detail="Invalid token")
-    user = crud.get_user_by_email(session=session, email=email)
-    if not user:
-        raise HTTPException(
-            status_code=404,
-            detail="The user with this email does not exist in the system.",
-        )
-    elif not user.is_active:
+    email = check_reset_token(body.token)
+    user = check_recovery_user(crud.get_user_by_email(session=session, email=email))
+    if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    hashed_password = get_password_hash(password=body.new_password)
-    user.hashed_password = hashed_password
-    session.add(user)
-    session.commit()
+    crud.update_password(session=session, db_user=user, password=body.new_password)
     return Message(message="Password updated successfully")
 
 
@@ -108,17 +131,4 @@ def recover_password_html_content(email: str, session: SessionDep) -> Any:
     HTML Content for Password Recovery
     """
     user = crud.get_user_by_email(session=session, email=email)
-
-    if not user:
-        raise HTTPException(
-            status_code=404,
-            detail="The user with this username does not exist in the system.",
-        )
-    password_reset_token = generate_password_reset_token(email=email)
-    email_data = generate_reset_password_email(
-        email_to=user.email, email=email, token=password_reset_token
-    )
-
-    return HTMLResponse(
-        content=email_data.html_content, headers={"subject:": email_data.subject}
-    )
+    return password_recovery_html_response(user, email)
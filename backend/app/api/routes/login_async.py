@@ -0,0 +1,92 @@
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import HTMLResponse
+from fastapi.security import OAuth2PasswordRequestForm
+
+from app import crud_async
+from app.api.deps import (
+    AsyncCurrentPrincipal,
+    AsyncSessionDep,
+    get_current_active_superuser_async,
+    limit_login,
+    limit_password_recovery,
+)
+from app.api.routes.login import (
+    access_token_response,
+    check_recovery_user,
+    check_reset_token,
+    password_recovery_html_response,
+)
+from app.models import Message, NewPassword, Token, UserPublic
+from app.utils import queue_reset_password_email
+
+# Async version of app.api.routes.login, used when settings.USE_ASYNC_DB is set
+
+router = APIRouter(tags=["login"])
+
+
+@router.post("/login/access-token", dependencies=[Depends(limit_login)])
+async def login_access_token(
+    session: AsyncSessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+) -> Token:
+    """
+    OAuth2 compatible token login, get an access token for future requests
+    """
+    user = await crud_async.authenticate(
+        session=session, email=form_data.username, password=form_data.password
+    )
+    return access_token_response(user)
+
+
+@router.post("/login/test-token", response_model=UserPublic)
+async def test_token(current_user: AsyncCurrentPrincipal) -> Any:
+    """
+    Test access token
+    """
+    return current_user
+
+
+@router.post(
+    "/password-recovery/{email}", dependencies=[Depends(limit_password_recovery)]
+)
+async def recover_password(email: str, session: AsyncSessionDep) -> Message:
+    """
+    Password Recovery
+    """
+    user = check_recovery_user(
+        await crud_async.get_user_by_email(session=session, email=email)
+    )
+    queue_reset_password_email(session=session, email_to=user.email, email=email)
+    await session.commit()
+    return Message(message="Password recovery email sent")
+
+
+@router.post("/reset-password/")
+async def reset_password(session: AsyncSessionDep, body: NewPassword) -> Message:
+    """
+    Reset password
+    """
+    email = check_reset_token(body.token)
+    user = check_recovery_user(
+        await crud_async.get_user_by_email(session=session, email=email)
+    )
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    await crud_async.update_password(
+        session=session, db_user=user, password=body.new_password
+    )
+    return Message(message="Password updated successfully")
+
+
+@router.post(
+    "/password-recovery-html-content/{email}",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_class=HTMLResponse,
+)
+async def recover_password_html_content(email: str, session: AsyncSessionDep) -> Any:
+    """
+    HTML Content for Password Recovery
+    """
+    user = await crud_async.get_user_by_email(session=session, email=email)
+    return password_recovery_html_response(user, email)
@@ -1,51 +1,156 @@
+import io
 import uuid
+from collections.abc import Sequence
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+import sqlalchemy
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile
+from sqlmodel import col, select
 
 from app import crud
 from app.api.deps import (
+    CurrentPrincipal,
     CurrentUser,
+    ReadSessionDep,
     SessionDep,
+    check_superuser,
     get_current_active_superuser,
 )
+from app.api.etags import (
+    IfMatch,
+    IfNoneMatch,
+    check_if_match,
+    is_not_modified,
+    not_modified,
+    row_etag,
+)
+from app.api.fields import (
+    UserFieldsDep,
+    construct_models,
+    page_include,
+    select_fields,
+)
+from app.api.pagination import CountModeDep, Pagination, PaginationDep
+from app.api.responses import model_response
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.security import verify_password
+from app.import_users import load_users
 from app.models import (
-    Item,
     Message,
     UpdatePassword,
     User,
     UserCreate,
+    UserImportFormat,
     UserPublic,
     UserRegister,
+    UsersImportResult,
     UsersPublic,
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
+from app.utils import queue_new_account_email
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# The route bodies are shared with app.api.routes.users_async, only the session
+# calls differ
+
+
+def read_users_statement(
+    pagination: Pagination, fields: list[str] | None
+) -> sqlalchemy.Select[Any]:
+    # Statement of users, or of rows of some of their columns
+    if fields is None:
+        return pagination.apply(select(User), col(User.id))
+    return pagination.apply(
+        select_fields(select(User), User, fields, "id"), col(User.id)
+    )
+
+
+def users_page_response(
+    rows: Sequence[Any],
+    count: int | None,
+    pagination: Pagination,
+    fields: list[str] | None,
+) -> Any:
+    users: Sequence[User | UserPublic]
+    users = rows if fields is None else construct_models(UserPublic, rows)
+    return model_response(
+        UsersPublic(data=users, count=count, next_cursor=pagination.next_cursor(users)),
+        include=page_include(fields),
+    )
+
+
+def check_email_unused(user: User | None, detail: str) -> None:
+    if user:
+        raise HTTPException(status_code=400, detail=detail)
+
+
+def check_email_conflict(existing_user: User | None, user_id: uuid.UUID) -> None:
+    # The email of a user can only change to one no other user has
+    if existing_user and existing_user.id != user_id:
+        raise HTTPException(
+            status_code=409, detail="User with this email already exists"
+        )
+
+
+def check_password_change(body: UpdatePassword, verified: bool) -> None:
+    if not verified:
+        raise HTTPException(status_code=400, detail="Incorrect password")
+    if body.current_password == body.new_password:
+        raise HTTPException(
+            status_code=400, detail="New password cannot be the same as the current one"
+        )
+
+
+def check_user_found(user: User | None) -> User:
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+def check_not_self(user: User, current_user: UserPublic) -> None:
+    if user.id == current_user.id:
+        raise HTTPException(
+            status_code=403, detail="Super users are not allowed to delete themselves"
+        )
+
+
+def user_response(
+    user: UserPublic, response: Response, if_none_match: str | None
+) -> Any:
+    etag = row_etag(user.id, user.version)
+    if is_not_modified(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return model_response(user, response)
+
 
 @router.get(
     "/",
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(
+    session: ReadSessionDep,
+    pagination: PaginationDep,
+    count_mode: CountModeDep,
+    fields: UserFieldsDep,
+) -> Any:
     """
     Retrieve users.
-    """
-
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    Pass the `next_cursor` of a page as `cursor` to get the next one, this is
+    faster than `skip` for deep pages. Use `count` to choose how the total is
+    computed, `estimated` and `none` are cheaper than `exact` on large tables.
+    Pass `fields` to only read and send some fields of the users, like
+    `fields=id,email`.
+    """
 
-    return UsersPublic(data=users, count=count)
+    count = crud.count_users(session=session, mode=count_mode)
+    statement = read_users_statement(pagination, fields)
+    rows = session.exec(statement).all()  # type: ignore[call-overload]
+    return users_page_response(rows, count, pagination, fields)
 
 
 @router.post(
@@ -55,26 +160,38 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
     """
     Create new user.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
-    if user:
-        raise HTTPException(
-            status_code=400,
-            detail="The user with this email already exists in the system.",
-        )
+    check_email_unused(
+        crud.get_user_by_email(session=session, email=user_in.email),
+        "The user with this email already exists in the system.",
+    )
 
-    user = crud.create_user(session=session, user_create=user_in)
     if settings.emails_enabled and user_in.email:
-        email_data = generate_new_account_email(
-            email_to=user_in.email, username=user_in.email, password=user_in.password
-        )
-        send_email(
-            email_to=user_in.email,
-            subject=email_data.subject,
-            html_content=email_data.html_content,
+        # Committed along with the user
+        queue_new_account_email(
+            session=session, email_to=user_in.email, username=user_in.email
         )
+    user = crud.create_user(session=session, user_create=user_in)
     return user
 
 
+@router.post(
+    "/import",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UsersImportResult,
+)
+def import_users(
+    session: SessionDep, file: UploadFile, format: UserImportFormat = "csv"
+) -> Any:
+    """
+    Import users from a CSV or NDJSON file.
+
+    CSV files have a header row naming the fields of each user. Users whose email
+    already exists are not changed, they are reported as conflicts.
+    """
+    with io.TextIOWrapper(file.file, encoding="utf-8", newline="") as text_file:
+        return load_users(session=session, file=text_file, format=format)
+
+
 @router.patch("/me", response_model=UserPublic)
 def update_user_me(
     *, session: SessionDep, user_in: UserUpdateMe, current_user: CurrentUser
@@ -85,16 +202,8 @@ def update_user_me(
 
     if user_in.email:
         existing_user = crud.get_user_by_email(session=session, email=user_in.email)
-        if existing_user and existing_user.id != current_user.id:
-            raise HTTPException(
-                status_code=409, detail="User with this email already exists"
-            )
-    user_data = user_in.model_dump(exclude_unset=True)
-    current_user.sqlmodel_update(user_data)
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
-    return current_user
+        check_email_conflict(existing_user, current_user.id)
+    return crud.update_user(session=session, db_user=current_user, user_in=user_in)
 
 
 @router.patch("/me/password", response_model=Message)
@@ -104,25 +213,27 @@ def update_password_me(
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
-        raise HTTPException(status_code=400, detail="Incorrect password")
-    if body.current_password == body.new_password:
-        raise HTTPException(
-            status_code=400, detail="New password cannot be the same as the current one"
-        )
-    hashed_password = get_password_hash(body.new_password)
-    current_user.hashed_password = hashed_password
-    session.add(current_user)
-    session.commit()
+    verified = verify_password(body.current_password, current_user.hashed_password)
+    check_password_change(body, verified)
+    crud.update_password(
+        session=session, db_user=current_user, password=body.new_password
+    )
     return Message(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+def read_user_me(
+    current_user: CurrentPrincipal,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
+) -> Any:
     """
     Get current user.
+
+    The user is not sent again when its ETag is passed in `If-None-Match`.
     """
-    return current_user
+    # The principal is cached, a match is answered without a query
+    return user_response(current_user, response, if_none_match)
 
 
 @router.delete("/me", response_model=Message)
@@ -134,10 +245,7 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Item).where(col(Item.owner_id) == current_user.id)
-    session.exec(statement)  # type: ignore
-    session.delete(current_user)
-    session.commit()
+    crud.delete_user(session=session, db_user=current_user)
     return Message(message="User deleted successfully")
 
 
@@ -146,12 +254,10 @@ def register_user(session: SessionDep, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
-    if user:
-        raise HTTPException(
-            status_code=400,
-            detail="The user with this email already exists in the system",
-        )
+    check_email_unused(
+        crud.get_user_by_email(session=session, email=user_in.email),
+        "The user with this email already exists in the system",
+    )
     user_create = UserCreate.model_validate(user_in)
     user = crud.create_user(session=session, user_create=user_create)
     return user
@@ -159,20 +265,22 @@ def register_user(session: SessionDep, user_in: UserRegister) -> Any:
 
 @router.get("/{user_id}", response_model=UserPublic)
 def read_user_by_id(
-    user_id: uuid.UUID, session: SessionDep, current_user: CurrentUser
+    user_id: uuid.UUID,
+    session: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
 ) -> Any:
     """
     Get a specific user by id.
+
+    The user is not sent again when its ETag is passed in `If-None-Match`.
     """
-    user = session.get(User, user_id)
-    if user == current_user:
-        return user
-    if not current_user.is_superuser:
-        raise HTTPException(
-            status_code=403,
-            detail="The user doesn't have enough privileges",
-        )
-    return user
+    if user_id == current_user.id:
+        return user_response(current_user, response, if_none_match)
+    check_superuser(current_user)
+    db_user = check_user_found(session.get(User, user_id))
+    return user_response(UserPublic.model_validate(db_user), response, if_none_match)
 
 
 @router.patch(
@@ -185,9 +293,14 @@ def update_user(
     session: SessionDep,
     user_id: uuid.UUID,
     user_in: UserUpdate,
+    response: Response,
+    if_match: IfMatch = None,
 ) -> Any:
     """
     Update a user.
+
+    Pass the ETag of the user in `If-Match` to only update it if it wasn't
+    modified since it was read.
     """
 
     db_user = session.get(User, user_id)
@@ -196,33 +309,24 @@ def update_user(
             status_code=404,
             detail="The user with this id does not exist in the system",
         )
+    check_if_match(if_match, row_etag(db_user.id, db_user.version))
     if user_in.email:
         existing_user = crud.get_user_by_email(session=session, email=user_in.email)
-        if existing_user and existing_user.id != user_id:
-            raise HTTPException(
-                status_code=409, detail="User with this email already exists"
-            )
+        check_email_conflict(existing_user, user_id)
 
     db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    response.headers["ETag"] = row_etag(db_user.id, db_user.version)
     return db_user
 
 
 @router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser)])
 def delete_user(
-    session: SessionDep, current_user: CurrentUser, user_id: uuid.UUID
+    session: SessionDep, current_user: CurrentPrincipal, user_id: uuid.UUID
 ) -> Message:
     """
     Delete a user.
     """
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    if user == current_user:
-        raise HTTPException(
-            status_code=403, detail="Super users are not allowed to delete themselves"
-        )
-    statement = delete(Item).where(col(Item.owner_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
+    user = check_user_found(session.get(User, user_id))
+    check_not_self(user, current_user)
+    crud.delete_user(session=session, db_user=user)
     return Message(message="User deleted successfully")
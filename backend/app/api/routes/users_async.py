@@ -0,0 +1,266 @@
+import uuid
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app import crud_async
+from app.api.deps import (
+    AsyncCurrentPrincipal,
+    AsyncCurrentUser,
+    AsyncReadSessionDep,
+    AsyncSessionDep,
+    check_superuser,
+    get_current_active_superuser_async,
+)
+from app.api.etags import IfMatch, IfNoneMatch, check_if_match, row_etag
+from app.api.fields import UserFieldsDep
+from app.api.pagination import CountModeDep, PaginationDep
+from app.api.routes.users import (
+    check_email_conflict,
+    check_email_unused,
+    check_not_self,
+    check_password_change,
+    check_user_found,
+    read_users_statement,
+    user_response,
+    users_page_response,
+)
+from app.core.config import settings
+from app.core.security import verify_password_async
+from app.import_users import load_users_from_file
+from app.models import (
+    Message,
+    UpdatePassword,
+    User,
+    UserCreate,
+    UserImportFormat,
+    UserPublic,
+    UserRegister,
+    UsersImportResult,
+    UsersPublic,
+    UserUpdate,
+    UserUpdateMe,
+)
+from app.utils import queue_new_account_email
+
+# Async version of app.api.routes.users, used when settings.USE_ASYNC_DB is set
+
+router = APIRouter(prefix="/users", tags=["users"])
+
+
+@router.get(
+    "/",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_model=UsersPublic,
+)
+async def read_users(
+    session: AsyncReadSessionDep,
+    pagination: PaginationDep,
+    count_mode: CountModeDep,
+    fields: UserFieldsDep,
+) -> Any:
+    """
+    Retrieve users.
+
+    Pass the `next_cursor` of a page as `cursor` to get the next one, this is
+    faster than `skip` for deep pages. Use `count` to choose how the total is
+    computed, `estimated` and `none` are cheaper than `exact` on large tables.
+    Pass `fields` to only read and send some fields of the users, like
+    `fields=id,email`.
+    """
+
+    count = await crud_async.count_users(session=session, mode=count_mode)
+    statement = read_users_statement(pagination, fields)
+    rows = (await session.exec(statement)).all()  # type: ignore[call-overload]
+    return users_page_response(rows, count, pagination, fields)
+
+
+@router.post(
+    "/",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_model=UserPublic,
+)
+async def create_user(*, session: AsyncSessionDep, user_in: UserCreate) -> Any:
+    """
+    Create new user.
+    """
+    check_email_unused(
+        await crud_async.get_user_by_email(session=session, email=user_in.email),
+        "The user with this email already exists in the system.",
+    )
+
+    if settings.emails_enabled and user_in.email:
+        # Committed along with the user
+        queue_new_account_email(
+            session=session, email_to=user_in.email, username=user_in.email
+        )
+    user = await crud_async.create_user(session=session, user_create=user_in)
+    return user
+
+
+@router.post(
+    "/import",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_model=UsersImportResult,
+)
+async def import_users(file: UploadFile, format: UserImportFormat = "csv") -> Any:
+    """
+    Import users from a CSV or NDJSON file.
+
+    CSV files have a header row naming the fields of each user. Users whose email
+    already exists are not changed, they are reported as conflicts.
+    """
+    return await run_in_threadpool(load_users_from_file, file.file, format)
+
+
+@router.patch("/me", response_model=UserPublic)
+async def update_user_me(
+    *, session: AsyncSessionDep, user_in: UserUpdateMe, current_user: AsyncCurrentUser
+) -> Any:
+    """
+    Update own user.
+    """
+
+    if user_in.email:
+        existing_user = await crud_async.get_user_by_email(
+            session=session, email=user_in.email
+        )
+        check_email_conflict(existing_user, current_user.id)
+    return await crud_async.update_user(
+        session=session, db_user=current_user, user_in=user_in
+    )
+
+
+@router.patch("/me/password", response_model=Message)
+async def update_password_me(
+    *, session: AsyncSessionDep, body: UpdatePassword, current_user: AsyncCurrentUser
+) -> Any:
+    """
+    Update own password.
+    """
+    verified = await verify_password_async(
+        body.current_password, current_user.hashed_password
+    )
+    check_password_change(body, verified)
+    await crud_async.update_password(
+        session=session, db_user=current_user, password=body.new_password
+    )
+    return Message(message="Password updated successfully")
+
+
+@router.get("/me", response_model=UserPublic)
+async def read_user_me(
+    current_user: AsyncCurrentPrincipal,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
+) -> Any:
+    """
+    Get current user.
+
+    The user is not sent again when its ETag is passed in `If-None-Match`.
+    """
+    # The principal is cached, a match is answered without a query
+    return user_response(current_user, response, if_none_match)
+
+
+@router.delete("/me", response_model=Message)
+async def delete_user_me(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser
+) -> Any:
+    """
+    Delete own user.
+    """
+    if current_user.is_superuser:
+        raise HTTPException(
+            status_code=403, detail="Super users are not allowed to delete themselves"
+        )
+    await crud_async.delete_user(session=session, db_user=current_user)
+    return Message(message="User deleted successfully")
+
+
+@router.post("/signup", response_model=UserPublic)
+async def register_user(session: AsyncSessionDep, user_in: UserRegister) -> Any:
+    """
+    Create new user without the need to be logged in.
+    """
+    check_email_unused(
+        await crud_async.get_user_by_email(session=session, email=user_in.email),
+        "The user with this email already exists in the system",
+    )
+    user_create = UserCreate.model_validate(user_in)
+    user = await crud_async.create_user(session=session, user_create=user_create)
+    return user
+
+
+@router.get("/{user_id}", response_model=UserPublic)
+async def read_user_by_id(
+    user_id: uuid.UUID,
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    response: Response,
+    if_none_match: IfNoneMatch = None,
+) -> Any:
+    """
+    Get a specific user by id.
+
+    The user is not sent again when its ETag is passed in `If-None-Match`.
+    """
+    if user_id == current_user.id:
+        return user_response(current_user, response, if_none_match)
+    check_superuser(current_user)
+    db_user = check_user_found(await session.get(User, user_id))
+    return user_response(UserPublic.model_validate(db_user), response, if_none_match)
+
+
+@router.patch(
+    "/{user_id}",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_model=UserPublic,
+)
+async def update_user(
+    *,
+    session: AsyncSessionDep,
+    user_id: uuid.UUID,
+    user_in: UserUpdate,
+    response: Response,
+    if_match: IfMatch = None,
+) -> Any:
+    """
+    Update a user.
+
+    Pass the ETag of the user in `If-Match` to only update it if it wasn't
+    modified since it was read.
+    """
+
+    db_user = await session.get(User, user_id)
+    if not db_user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this id does not exist in the system",
+        )
+    check_if_match(if_match, row_etag(db_user.id, db_user.version))
+    if user_in.email:
+        existing_user = await crud_async.get_user_by_email(
+            session=session, email=user_in.email
+        )
+        check_email_conflict(existing_user, user_id)
+
+    db_user = await crud_async.update_user(
+        session=session, db_user=db_user, user_in=user_in
+    )
+    response.headers["ETag"] = row_etag(db_user.id, db_user.version)
+    return db_user
+
+
+@router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser_async)])
+async def delete_user(
+    session: AsyncSessionDep, current_user: AsyncCurrentPrincipal, user_id: uuid.UUID
+) -> Message:
+    """
+    Delete a user.
+    """
+    user = check_user_found(await session.get(User, user_id))
+    check_not_self(user, current_user)
+    await crud_async.delete_user(session=session, db_user=user)
+    return Message(message="User deleted successfully")
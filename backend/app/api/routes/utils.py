@@ -1,8 +1,15 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.core import security
+from app.core.cache import TTLCache
+from app.core.db import get_engines, get_pool_status
+from app.core.slow_queries import get_slow_queries
+from app.crud import item_count_cache
+from app.models import CacheStatus, Message, RuntimeStats, SlowQuery
 from app.utils import generate_test_email, send_email
 
 router = APIRouter(prefix="/utils", tags=["utils"])
@@ -26,6 +33,46 @@ def test_email(email_to: EmailStr) -> Message:
     return Message(message="Test email sent")
 
 
+def get_cache_status(name: str, cache: TTLCache[Any, Any]) -> CacheStatus:
+    return CacheStatus(
+        name=name,
+        size=len(cache),
+        maxsize=cache.maxsize,
+        hits=cache.hits,
+        misses=cache.misses,
+    )
+
+
+@router.get(
+    "/stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def read_runtime_stats() -> RuntimeStats:
+    """
+    Live statistics of this worker process.
+    """
+    return RuntimeStats(
+        db_pools=[get_pool_status(db_engine) for db_engine in get_engines()],
+        password_hashing=security.get_password_hash_status(),
+        caches=[
+            get_cache_status("token", security.token_cache),
+            get_cache_status("authenticated_user", security.authenticated_user_cache),
+            get_cache_status("item_count", item_count_cache),
+        ],
+    )
+
+
+@router.get(
+    "/slow-queries/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def read_slow_queries() -> list[SlowQuery]:
+    """
+    Slow statements recorded by this worker process, newest first.
+    """
+    return get_slow_queries()
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
@@ -0,0 +1,328 @@
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import sys
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+from sqlalchemy import delete, insert
+from sqlmodel import Session, col
+
+from app import crud
+from app.core import security
+from app.core.config import settings
+from app.core.db import engine
+from app.main import app
+from app.models import Item, OutboxEmail, User
+
+# Seeds users and items in the configured database, drives the ASGI app in
+# process with concurrent requests and prints the latency percentiles and the
+# throughput of each scenario as JSON, to compare runs between commits:
+#
+#   python -m app.benchmarks.api --users 50 --items 10000 --output before.json
+#
+# The seeded users, their items, the users signed up and their welcome emails
+# are deleted afterwards.
+
+PASSWORD = "benchmark-password"
+PAGE_SIZE = 100
+SEED_BATCH_SIZE = 1000
+
+
+@dataclass
+class Context:
+    client: httpx.AsyncClient
+    prefix: str
+    emails: list[str]
+    headers: list[dict[str, str]]
+    superuser_headers: dict[str, str]
+    # Items created by the item_create scenario, with the headers of their owner
+    created: list[tuple[dict[str, str], str]] = field(default_factory=list)
+
+
+Scenario = Callable[[Context, int], Awaitable[httpx.Response]]
+
+
+def token_headers(user_id: uuid.UUID) -> dict[str, str]:
+    token = security.create_access_token(user_id, expires_delta=timedelta(hours=1))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def seed(prefix: str, users: int, items: int) -> list[uuid.UUID]:
+    # Every user shares one hash, hashing a password per user would take longer
+    # than the benchmark
+    hashed_password = security.get_password_hash(PASSWORD)
+    user_ids = [uuid.uuid4() for _ in range(users)]
+    with Session(engine) as session:
+        session.execute(
+            insert(User),
+            [
+                {
+                    "id": user_id,
+                    "email": f"{prefix}{i}@example.com",
+                    "hashed_password": hashed_password,
+                    "is_active": True,
+                    "is_superuser": False,
+                }
+                for i, user_id in enumerate(user_ids)
+            ],
+        )
+        for start in range(0, items, SEED_BATCH_SIZE):
+            session.execute(
+                insert(Item),
+                [
+                    {
+                        "id": uuid.uuid4(),
+                        "title": f"Item {i}",
+                        "description": "Seeded by the API benchmark",
+                        "owner_id": user_ids[i % users],
+                    }
+                    for i in range(start, min(start + SEED_BATCH_SIZE, items))
+                ],
+            )
+        session.commit()
+    return user_ids
+
+
+def cleanup(prefix: str) -> None:
+    # Items are deleted with their owner by the foreign key
+    with Session(engine) as session:
+        session.execute(delete(User).where(col(User.email).startswith(prefix)))
+        session.execute(
+            delete(OutboxEmail).where(col(OutboxEmail.email_to).startswith(prefix))
+        )
+        session.commit()
+
+
+async def login(ctx: Context, i: int) -> httpx.Response:
+    return await ctx.client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": ctx.emails[i % len(ctx.emails)], "password": PASSWORD},
+    )
+
+
+async def read_user_me(ctx: Context, i: int) -> httpx.Response:
+    return await ctx.client.get(
+        f"{settings.API_V1_STR}/users/me", headers=ctx.headers[i % len(ctx.headers)]
+    )
+
+
+async def signup(ctx: Context, i: int) -> httpx.Response:
+    return await ctx.client.post(
+        f"{settings.API_V1_STR}/users/signup",
+        json={"email": f"{ctx.prefix}signup-{i}@example.com", "password": PASSWORD},
+    )
+
+
+def read_items_page(skip: int) -> Scenario:
+    # The superuser lists the items of every user, deep pages scan the table
+    async def read_items(ctx: Context, _i: int) -> httpx.Response:
+        return await ctx.client.get(
+            f"{settings.API_V1_STR}/items/",
+            params={"skip": skip, "limit": PAGE_SIZE},
+            headers=ctx.superuser_headers,
+        )
+
+    return read_items
+
+
+async def create_item(ctx: Context, i: int) -> httpx.Response:
+    headers = ctx.headers[i % len(ctx.headers)]
+    r = await ctx.client.post(
+        f"{settings.API_V1_STR}/items/",
+        json={"title": f"Item {i}", "description": "Created by the API benchmark"},
+        headers=headers,
+    )
+    if r.is_success:
+        ctx.created.append((headers, r.json()["id"]))
+    return r
+
+
+async def read_item(ctx: Context, i: int) -> httpx.Response:
+    headers, item_id = ctx.created[i % len(ctx.created)]
+    return await ctx.client.get(
+        f"{settings.API_V1_STR}/items/{item_id}", headers=headers
+    )
+
+
+async def update_item(ctx: Context, i: int) -> httpx.Response:
+    headers, item_id = ctx.created[i % len(ctx.created)]
+    return await ctx.client.put(
+        f"{settings.API_V1_STR}/items/{item_id}",
+        json={"title": f"Updated item {i}"},
+        headers=headers,
+    )
+
+
+async def delete_item(ctx: Context, i: int) -> httpx.Response:
+    # Runs as many requests as item_create, so each item is deleted once
+    headers, item_id = ctx.created[i % len(ctx.created)]
+    return await ctx.client.delete(
+        f"{settings.API_V1_STR}/items/{item_id}", headers=headers
+    )
+
+
+def get_scenarios(page_depths: list[int]) -> dict[str, Scenario]:
+    # The item scenarios run in order, on the items created by item_create
+    return {
+        "login": login,
+        "read_user_me": read_user_me,
+        **{f"read_items_skip_{skip}": read_items_page(skip) for skip in page_depths},
+        "item_create": create_item,
+        "item_read": read_item,
+        "item_update": update_item,
+        "item_delete": delete_item,
+        "signup": signup,
+    }
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, Any]:
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p95_ms": round(percentiles[94] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+async def run_scenario(
+    ctx: Context, scenario: Scenario, requests: int, concurrency: int
+) -> dict[str, Any]:
+    latencies: list[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker() -> None:
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            start = time.perf_counter()
+            r = await scenario(ctx, i)
+            latencies.append(time.perf_counter() - start)
+            if r.is_error:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run_scenarios(
+    *,
+    prefix: str,
+    user_ids: list[uuid.UUID],
+    superuser_id: uuid.UUID,
+    page_depths: list[int],
+    requests: int,
+    concurrency: int,
+) -> dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(transport=transport, base_url="http://bench") as client,
+    ):
+        ctx = Context(
+            client=client,
+            prefix=prefix,
+            emails=[f"{prefix}{i}@example.com" for i in range(len(user_ids))],
+            headers=[token_headers(user_id) for user_id in user_ids],
+            superuser_headers=token_headers(superuser_id),
+        )
+        return {
+            name: await run_scenario(ctx, scenario, requests, concurrency)
+            for name, scenario in get_scenarios(page_depths).items()
+        }
+
+
+def run(
+    *,
+    users: int,
+    items: int,
+    page_depths: list[int],
+    requests: int,
+    concurrency: int,
+) -> dict[str, Any]:
+    with Session(engine) as session:
+        superuser = crud.get_user_by_email(
+            session=session, email=settings.FIRST_SUPERUSER
+        )
+    assert superuser, "Create the first superuser before running the benchmark"
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    # Every request comes from one client, the logins would be rate limited
+    with patch.object(settings, "RATE_LIMIT_BACKEND", "none"):
+        try:
+            user_ids = seed(prefix, users, items)
+            scenarios = asyncio.run(
+                run_scenarios(
+                    prefix=prefix,
+                    user_ids=user_ids,
+                    superuser_id=superuser.id,
+                    page_depths=page_depths,
+                    requests=requests,
+                    concurrency=concurrency,
+                )
+            )
+        finally:
+            cleanup(prefix)
+    return {
+        "config": {
+            "users": users,
+            "items": items,
+            "requests": requests,
+            "concurrency": concurrency,
+            "use_async_db": settings.USE_ASYNC_DB,
+            "fast_json_responses": settings.FAST_JSON_RESPONSES,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure the latency and throughput of the API"
+    )
+    parser.add_argument("--users", type=int, default=20, help="Users to seed")
+    parser.add_argument("--items", type=int, default=5000, help="Items to seed")
+    parser.add_argument(
+        "--page-depths",
+        type=lambda value: [int(skip) for skip in value.split(",")],
+        default=[0, 1000, 4000],
+        help="Comma separated skip values of the listed item pages",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Requests per scenario"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="Requests in flight"
+    )
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(
+        users=args.users,
+        items=args.items,
+        page_depths=args.page_depths,
+        requests=args.requests,
+        concurrency=args.concurrency,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
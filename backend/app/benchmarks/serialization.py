@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from app.api.responses import ModelResponse
+from app.models import Item, ItemsPublic
+
+# Compares rendering a page of items through FastAPI's response model, as routes
+# returning objects do, with rendering it from the model with pydantic-core:
+#
+#   python -m app.benchmarks.serialization --items 100
+
+Render = Callable[[], Awaitable[bytes]]
+
+
+def make_page(size: int) -> list[Item]:
+    owner_id = uuid.uuid4()
+    return [
+        Item(title=f"Item {i}", description="A" * 100, owner_id=owner_id)
+        for i in range(size)
+    ]
+
+
+def response_model_path(items: list[Item]) -> Render:
+    route = APIRoute("/", lambda: None, response_model=ItemsPublic)
+
+    async def render() -> bytes:
+        content = await serialize_response(
+            field=route.response_field,
+            response_content=ItemsPublic(data=items, count=len(items)),
+        )
+        return bytes(JSONResponse(content).body)
+
+    return render
+
+
+def model_response_path(items: list[Item]) -> Render:
+    async def render() -> bytes:
+        return bytes(ModelResponse(ItemsPublic(data=items, count=len(items))).body)
+
+    return render
+
+
+async def measure(render: Render, number: int, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await render()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+async def run(size: int, number: int) -> None:
+    items = make_page(size)
+    paths = {
+        "response_model": response_model_path(items),
+        "model_response": model_response_path(items),
+    }
+    bodies = {await render() for render in paths.values()}
+    assert len(bodies) == 1, "Both paths must render the same body"
+    timings = {}
+    for name, render in paths.items():
+        timings[name] = await measure(render, number)
+        print(f"{name:>15}: {timings[name] * 1e6:9.1f} µs per page")
+    speedup = timings["response_model"] / timings["model_response"]
+    print(f"{'speedup':>15}: {speedup:9.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time the serialization of a page of items"
+    )
+    parser.add_argument("--items", type=int, default=100, help="Items per page")
+    parser.add_argument("--number", type=int, default=1000, help="Pages per run")
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.number))
+
+
+if __name__ == "__main__":
+    main()
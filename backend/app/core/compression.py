@@ -0,0 +1,258 @@
+import importlib
+import zlib
+from collections.abc import Callable, Sequence
+from types import ModuleType
+from typing import Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+
+def optional_import(name: str) -> ModuleType | None:
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+# Brotli and zstd are offered when their packages are installed
+brotli = optional_import("brotli")
+zstandard = optional_import("zstandard")
+
+
+class Encoder(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    # Output all the data compressed so far, so that the client can decode it
+    # before the next chunk
+    def flush(self) -> bytes: ...
+
+    def finish(self) -> bytes: ...
+
+
+class GzipEncoder:
+    def __init__(self, level: int) -> None:
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, level: int) -> None:
+        assert brotli is not None
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(self.compressor.process(data))
+
+    def flush(self) -> bytes:
+        return bytes(self.compressor.flush())
+
+    def finish(self) -> bytes:
+        return bytes(self.compressor.finish())
+
+
+class ZstdEncoder:
+    def __init__(self, level: int) -> None:
+        assert zstandard is not None
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return bytes(self.compressor.compress(data))
+
+    def flush(self) -> bytes:
+        assert zstandard is not None
+        return bytes(self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+
+    def finish(self) -> bytes:
+        return bytes(self.compressor.flush())
+
+
+# Packages of the codings that need one
+ENCODING_PACKAGES = {"br": "brotli", "zstd": "zstandard"}
+
+
+def get_encoders() -> dict[str, Callable[[], Encoder]]:
+    # The encoders that can be used, by content coding
+    encoders: dict[str, Callable[[], Encoder]] = {
+        "gzip": lambda: GzipEncoder(settings.COMPRESSION_GZIP_LEVEL)
+    }
+    if brotli is not None:
+        encoders["br"] = lambda: BrotliEncoder(settings.COMPRESSION_BROTLI_LEVEL)
+    if zstandard is not None:
+        encoders["zstd"] = lambda: ZstdEncoder(settings.COMPRESSION_ZSTD_LEVEL)
+    return encoders
+
+
+def check_encodings(encodings: Sequence[str]) -> None:
+    # Fail at startup rather than silently not using a configured coding
+    encoders = get_encoders()
+    missing = [ENCODING_PACKAGES[e] for e in encodings if e not in encoders]
+    if missing:
+        raise RuntimeError(
+            "COMPRESSION_ENCODINGS needs packages that are not installed: "
+            + ", ".join(missing)
+        )
+
+
+def coding_etag(etag: str, encoding: str) -> str:
+    """
+    ETag of the compressed representation of a response. Representations with
+    different codings can't share a strong validator, the coding is added to
+    the opaque tag, like `"abc"` to `"abc-gzip"`.
+    """
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def strip_etag_coding(etag: str) -> str:
+    # The ETag of the identity representation of a compressed one
+    for encoding in ("zstd", "br", "gzip"):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag.removesuffix(suffix) + '"'
+    return etag
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    # Quality of each coding accepted by the client, invalid qualities are 0
+    qualities = {}
+    for part in header.split(","):
+        coding, *params = (value.strip() for value in part.split(";"))
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities
+
+
+def select_encoding(accept_encoding: str, available: Sequence[str]) -> str | None:
+    """
+    The first available coding, in the configured order, accepted by the client
+    with a non zero quality.
+    """
+    qualities = parse_accept_encoding(accept_encoding)
+    for encoding in available:
+        if qualities.get(encoding, qualities.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def is_compressible(message: Message) -> bool:
+    if message["status"] in (204, 304):
+        return False
+    headers = Headers(raw=message["headers"])
+    if "content-encoding" in headers:
+        return False
+    media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    return media_type in settings.COMPRESSION_CONTENT_TYPES
+
+
+class CompressionMiddleware:
+    """
+    Compress the responses with the best coding accepted by the client.
+
+    Streamed responses are compressed chunk by chunk, each chunk is sent as soon
+    as it's compressed. Their size is not known, so they are compressed
+    regardless of COMPRESSION_MIN_SIZE.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        check_encodings(settings.COMPRESSION_ENCODINGS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoders = get_encoders()
+        available = [e for e in settings.COMPRESSION_ENCODINGS if e in encoders]
+        encoding = select_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), available
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        # The start of the response is held until its first body message tells
+        # whether it's worth compressing
+        start: Message | None = None
+        encoder: Encoder | None = None
+
+        def tag_not_modified(start_message: Message) -> None:
+            # A 304 has no body to compress, it validates the representation the
+            # client has, the compressed one when it sent its ETag
+            assert encoding is not None
+            headers = MutableHeaders(scope=start_message)
+            if "etag" not in headers:
+                return
+            etag = coding_etag(headers["etag"], encoding)
+            if_none_match = Headers(scope=scope).get("if-none-match", "")
+            if etag in (tag.strip() for tag in if_none_match.split(",")):
+                headers["ETag"] = etag
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                start_message, start = start, None
+                if start_message["status"] == 304:
+                    tag_not_modified(start_message)
+                small = not more_body and len(body) < max(
+                    settings.COMPRESSION_MIN_SIZE, 1
+                )
+                if small or not is_compressible(start_message):
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = encoders[encoding]()
+                headers = MutableHeaders(scope=start_message)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers:
+                    headers["ETag"] = coding_etag(headers["etag"], encoding)
+                del headers["Content-Length"]
+                if not more_body:
+                    body = encoder.compress(body) + encoder.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            if encoder is None:
+                await send(message)
+                return
+            body = encoder.compress(body)
+            body += encoder.flush() if more_body else encoder.finish()
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_compressed)
@@ -1,10 +1,253 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import Engine, exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection, QueuePool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.core.query_stats import instrument_engine
+from app.models import PoolStatus, User, UserCreate
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the pool checkout wait time histogram buckets
+CHECKOUT_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class PoolStats:
+    """
+    Checkout telemetry of a connection pool, shared by all the threads of the
+    current process.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.wait_buckets = [0] * (len(CHECKOUT_WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+        self.wait_count = 0
+        self.timeouts = 0
+
+    def observe_wait(self, seconds: float) -> None:
+        index = bisect.bisect_left(CHECKOUT_WAIT_BUCKETS, seconds)
+        with self.lock:
+            self.wait_buckets[index] += 1
+            self.wait_sum += seconds
+            self.wait_count += 1
+
+    def observe_timeout(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+
+
+# Keyed by the pool logging name, so that stats survive a pool being recreated
+pool_stats: dict[str, PoolStats] = {}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waits for a connection and how
+    many checkouts time out.
+    """
+
+    def connect(self) -> PoolProxiedConnection:
+        stats = pool_stats.setdefault(self._orig_logging_name or "default", PoolStats())
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            stats.observe_timeout()
+            raise
+        finally:
+            stats.observe_wait(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    pass
+
+
+def get_pool_options(name: str) -> dict[str, Any]:
+    return {
+        "pool_logging_name": name,
+        "pool_size": settings.POSTGRES_POOL_SIZE,
+        "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+        "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+        "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+        "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedQueuePool,
+    **get_pool_options("primary"),
+)
+# psycopg supports both sync and asyncio, the same URL works for both engines
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedAsyncQueuePool,
+    **get_pool_options("primary-async"),
+)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+
+@dataclass
+class Replica:
+    name: str
+    engine: Engine
+    async_engine: AsyncEngine
+    healthy: bool = True
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+class ReplicaSet:
+    """
+    Read replicas used in turn, the ones that failed their last health check
+    are skipped. Without any healthy replica, reads go to the primary.
+
+    Replicas lag behind the primary, only use them for reads that don't need to
+    see the latest writes.
+    """
+
+    def __init__(self, replicas: list[Replica]) -> None:
+        self.replicas = replicas
+        self._turns = itertools.count()
+
+    def next_replica(self) -> Replica | None:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._turns) % len(healthy)]
+
+    def get_engine(self) -> Engine:
+        replica = self.next_replica()
+        return replica.engine if replica else engine
+
+    def get_async_engine(self) -> AsyncEngine:
+        replica = self.next_replica()
+        return replica.async_engine if replica else async_engine
+
+    async def check_replica(self, replica: Replica) -> None:
+        try:
+            async with replica.async_engine.connect() as connection:
+                await asyncio.wait_for(
+                    connection.execute(text("SELECT 1")),
+                    settings.POSTGRES_REPLICA_HEALTH_CHECK_TIMEOUT,
+                )
+            healthy = True
+        except (exc.SQLAlchemyError, OSError, asyncio.TimeoutError):
+            healthy = False
+        if healthy != replica.healthy:
+            logger.warning(
+                "Read replica %s is %s",
+                replica.name,
+                "healthy again" if healthy else "unhealthy, skipping it",
+            )
+        replica.healthy = healthy
+
+    async def check_health(self) -> None:
+        await asyncio.gather(*(self.check_replica(r) for r in self.replicas))
+
+    async def check_health_periodically(self) -> None:
+        while True:
+            await self.check_health()
+            await asyncio.sleep(settings.POSTGRES_REPLICA_HEALTH_CHECK_INTERVAL)
+
+
+def create_replica(index: int, url: str) -> Replica:
+    name = f"replica-{index}"
+    # Give up on unreachable replicas as fast as the health check does
+    connect_args = {
+        "connect_timeout": math.ceil(settings.POSTGRES_REPLICA_HEALTH_CHECK_TIMEOUT)
+    }
+    replica = Replica(
+        name=name,
+        engine=create_engine(
+            url,
+            poolclass=InstrumentedQueuePool,
+            connect_args=connect_args,
+            **get_pool_options(name),
+        ),
+        async_engine=create_async_engine(
+            url,
+            poolclass=InstrumentedAsyncQueuePool,
+            connect_args=connect_args,
+            **get_pool_options(f"{name}-async"),
+        ),
+    )
+    instrument_engine(replica.engine)
+    instrument_engine(replica.async_engine.sync_engine)
+    return replica
+
+
+replicas = ReplicaSet(
+    [
+        create_replica(index, str(url))
+        for index, url in enumerate(settings.POSTGRES_REPLICA_URLS)
+    ]
+)
+
+
+def get_engines() -> list[Engine]:
+    # The engines of every pool of this process, the sync ones of async engines
+    engines = [engine, async_engine.sync_engine]
+    for replica in replicas.replicas:
+        engines += [replica.engine, replica.async_engine.sync_engine]
+    return engines
+
+
+def get_sync_engine(db_engine: Engine) -> Engine:
+    # The sync engine of the database of an engine, the sync engines of async
+    # engines can only connect from the event loop
+    if db_engine is async_engine.sync_engine:
+        return engine
+    for replica in replicas.replicas:
+        if db_engine is replica.async_engine.sync_engine:
+            return replica.engine
+    return db_engine
+
+
+def get_pool_status(db_engine: Engine) -> PoolStatus:
+    pool = db_engine.pool
+    assert isinstance(pool, QueuePool)
+    name = pool._orig_logging_name or "default"
+    stats = pool_stats.get(name) or PoolStats()
+    with stats.lock:
+        wait_buckets = list(stats.wait_buckets)
+        wait_sum, wait_count, timeouts = (
+            stats.wait_sum,
+            stats.wait_count,
+            stats.timeouts,
+        )
+    # Report cumulative counts keyed by bucket upper bound, as Prometheus does
+    buckets: dict[str, int] = {}
+    cumulative = 0
+    for bound, count in zip(
+        (*CHECKOUT_WAIT_BUCKETS, math.inf), wait_buckets, strict=True
+    ):
+        cumulative += count
+        buckets[str(bound)] = cumulative
+    return PoolStatus(
+        name=name,
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=pool.overflow(),
+        checkout_timeouts=timeouts,
+        checkout_wait_count=wait_count,
+        checkout_wait_seconds_sum=wait_sum,
+        checkout_wait_buckets=buckets,
+    )
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
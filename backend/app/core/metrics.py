@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+
+from fastapi.routing import APIRoute
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy.pool import QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import security
+from app.core.db import get_engines, pool_stats
+
+# With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+# directory shared by the workers, each one writes its metrics there and the
+# scraped worker aggregates them all
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROCESS_DIR:
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+
+# Seconds between updates of the gauges of each process
+GAUGES_REFRESH_SECONDS = 1.0
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status code",
+    ["method", "route", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being served",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Connections kept in the database pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Database connections in use",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Database connections opened over the pool size",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts",
+    "Database connection checkouts that timed out",
+    ["pool"],
+)
+PASSWORD_HASH_QUEUED = Gauge(
+    "password_hash_queued",
+    "Password hashes waiting for a bcrypt thread",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_RUNNING = Gauge(
+    "password_hash_running",
+    "Password hashes being computed",
+    multiprocess_mode="livesum",
+)
+
+
+def get_route_name(scope: Scope) -> str:
+    # The router stores the matched route in the scope
+    route = scope.get("route")
+    if isinstance(route, APIRoute):
+        return route.unique_id
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Count the requests and time them by route.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            in_progress.dec()
+            route = get_route_name(scope)
+            REQUEST_DURATION.labels(method, route).observe(duration)
+            REQUESTS.labels(method, route, str(status_code)).inc()
+
+
+# Checkout timeouts of each pool already added to DB_POOL_CHECKOUT_TIMEOUTS
+exported_checkout_timeouts: dict[str, int] = {}
+
+
+def refresh_gauges() -> None:
+    for db_engine in get_engines():
+        pool = db_engine.pool
+        assert isinstance(pool, QueuePool)
+        name = pool._orig_logging_name or "default"
+        DB_POOL_SIZE.labels(name).set(pool.size())
+        DB_POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+        DB_POOL_OVERFLOW.labels(name).set(pool.overflow())
+        # The pool counts the timeouts, the counter gets the new ones
+        stats = pool_stats.get(name)
+        timeouts = stats.timeouts if stats else 0
+        exported = exported_checkout_timeouts.get(name, 0)
+        DB_POOL_CHECKOUT_TIMEOUTS.labels(name).inc(timeouts - exported)
+        exported_checkout_timeouts[name] = timeouts
+    PASSWORD_HASH_QUEUED.set(security.password_hash_stats.queued)
+    PASSWORD_HASH_RUNNING.set(security.password_hash_stats.running)
+
+
+async def refresh_gauges_periodically() -> None:
+    # Each process updates its own gauges, whichever process is scraped
+    while True:
+        refresh_gauges()
+        await asyncio.sleep(GAUGES_REFRESH_SECONDS)
+
+
+def mark_process_dead() -> None:
+    # Drop the live gauges of this process from the aggregation
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(os.getpid())  # type: ignore[no-untyped-call]
+
+
+def generate_metrics() -> bytes:
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+        return generate_latest(registry)
+    refresh_gauges()
+    return generate_latest(REGISTRY)
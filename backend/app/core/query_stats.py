@@ -0,0 +1,139 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.slow_queries import record_slow_query
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryStats:
+    """
+    Statements run while serving a request, and the time spent in them.
+    """
+
+    count: int = 0
+    duration: float = 0.0
+    # Times each statement ran, statements are parameterized, so queries with
+    # the same shape but different values are counted together
+    statements: Counter[str] = field(default_factory=Counter)
+    scope: Scope = field(default_factory=dict)
+
+    def route_name(self) -> str:
+        # The path of the matched route, once the router has run
+        route = self.scope.get("route")
+        path = getattr(route, "path", self.scope.get("path"))
+        return f"{self.scope.get('method')} {path}"
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries"'
+
+
+# Stats of the request being served, sync routes run in a copy of the context so
+# they update the same object
+current_query_stats: ContextVar[QueryStats | None] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+def is_transaction_control(statement: str) -> bool:
+    # Like BEGIN and COMMIT, which don't go through a cursor, SAVEPOINTs aren't
+    # counted as queries
+    return statement.startswith(("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO"))
+
+
+def before_cursor_execute(
+    _conn: Any,
+    _cursor: Any,
+    _statement: str,
+    _parameters: Any,
+    context: Any,
+    _executemany: bool,
+) -> None:
+    context.query_start_time = time.perf_counter()
+
+
+def after_cursor_execute(
+    conn: Any,
+    _cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    duration = time.perf_counter() - context.query_start_time
+    stats = current_query_stats.get()
+    if stats is not None and not is_transaction_control(statement):
+        stats.count += 1
+        stats.duration += duration
+        stats.statements[statement] += 1
+    record_slow_query(
+        statement=statement,
+        parameters=parameters,
+        executemany=executemany,
+        duration=duration,
+        route=stats.route_name() if stats is not None else None,
+        db_engine=conn.engine,
+    )
+
+
+def instrument_engine(db_engine: Engine) -> None:
+    event.listen(db_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", after_cursor_execute)
+
+
+def check_query_stats(stats: QueryStats, route: str) -> None:
+    if stats.count > settings.QUERY_BUDGET:
+        logger.warning(
+            "%s ran %s queries, over the budget of %s",
+            route,
+            stats.count,
+            settings.QUERY_BUDGET,
+        )
+    for statement, count in stats.statements.items():
+        if count >= settings.QUERY_REPEAT_THRESHOLD:
+            logger.warning(
+                "%s ran the same query %s times, possible N+1: %s",
+                route,
+                count,
+                " ".join(statement.split())[:200],
+            )
+
+
+class QueryStatsMiddleware:
+    """
+    Count the statements of each request, report them in a Server-Timing header
+    and warn about requests over the query budget.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope=scope)
+        token = current_query_stats.set(stats)
+
+        async def send_with_server_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            current_query_stats.reset(token)
+            check_query_stats(stats, stats.route_name())
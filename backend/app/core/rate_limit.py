@@ -0,0 +1,171 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Protocol
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.db import engine
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """
+    Token bucket allowing bursts of up to `capacity` requests, refilled with
+    `capacity` tokens per `period` seconds.
+    """
+
+    name: str
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        # Tokens added per second
+        return self.capacity / self.period
+
+
+class RateLimitBackend(Protocol):
+    def acquire(self, key: str, limit: RateLimit) -> float:
+        """
+        Take a token from the bucket of the key. Return 0 when one was taken,
+        else the seconds until one is available.
+        """
+        ...
+
+
+class MemoryRateLimitBackend:
+    """
+    Buckets of this worker process, each process limits the requests it serves
+    on its own.
+
+    The least recently used buckets are dropped past `maxsize`, which refills
+    them.
+    """
+
+    def __init__(self, *, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # Tokens of each bucket and when they were counted
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def acquire(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, counted_at = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - counted_at) * limit.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / limit.rate
+            self._buckets[key] = (tokens - 1 if wait == 0 else tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+# Refills the bucket and takes a token when there is one, in one statement so
+# that concurrent requests can't take the same token. A rejected request leaves
+# the bucket as is, and gets the time until it holds a token again
+ACQUIRE_STATEMENT = text("""
+WITH acquired AS (
+    INSERT INTO rate_limit_bucket AS bucket (key, tokens, updated_at)
+    VALUES (:key, :capacity - 1, now())
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = LEAST(
+            :capacity,
+            bucket.tokens
+            + EXTRACT(EPOCH FROM now() - bucket.updated_at) * :rate
+        ) - 1,
+        updated_at = now()
+    WHERE LEAST(
+        :capacity,
+        bucket.tokens + EXTRACT(EPOCH FROM now() - bucket.updated_at) * :rate
+    ) >= 1
+    RETURNING bucket.key
+)
+SELECT 0.0 FROM acquired
+UNION ALL
+SELECT (1 - tokens - EXTRACT(EPOCH FROM now() - updated_at) * :rate) / :rate
+FROM rate_limit_bucket
+WHERE key = :key AND NOT EXISTS (SELECT FROM acquired)
+""")
+
+# Buckets not used for longer than the period of any limit are full again, as
+# if they didn't exist
+DELETE_IDLE_BUCKETS_STATEMENT = text("""
+DELETE FROM rate_limit_bucket
+WHERE updated_at < now() - make_interval(secs => :idle_seconds)
+""")
+# Fraction of the requests that delete the idle buckets
+DELETE_IDLE_BUCKETS_RATE = 0.001
+
+
+class PostgresRateLimitBackend:
+    """
+    Buckets in an unlogged table of the database, shared by every worker process
+    and server. Limits are reset when Postgres crashes.
+    """
+
+    def __init__(self, *, idle_seconds: float) -> None:
+        self.idle_seconds = idle_seconds
+
+    def acquire(self, key: str, limit: RateLimit) -> float:
+        with engine.connect() as connection:
+            wait = connection.execute(
+                ACQUIRE_STATEMENT,
+                {"key": key, "capacity": limit.capacity, "rate": limit.rate},
+            ).scalar_one()
+            if random.random() < DELETE_IDLE_BUCKETS_RATE:
+                connection.execute(
+                    DELETE_IDLE_BUCKETS_STATEMENT,
+                    {"idle_seconds": self.idle_seconds},
+                )
+            connection.commit()
+        return float(wait)
+
+
+LOGIN_PER_IP = RateLimit(
+    name="login-ip", capacity=settings.LOGIN_ATTEMPTS_PER_MINUTE_PER_IP, period=60
+)
+LOGIN_PER_ACCOUNT = RateLimit(
+    name="login-account",
+    capacity=settings.LOGIN_ATTEMPTS_PER_MINUTE_PER_ACCOUNT,
+    period=60,
+)
+PASSWORD_RECOVERY_PER_IP = RateLimit(
+    name="password-recovery-ip",
+    capacity=settings.PASSWORD_RECOVERIES_PER_HOUR_PER_IP,
+    period=3600,
+)
+PASSWORD_RECOVERY_PER_ACCOUNT = RateLimit(
+    name="password-recovery-account",
+    capacity=settings.PASSWORD_RECOVERIES_PER_HOUR_PER_ACCOUNT,
+    period=3600,
+)
+
+memory_backend = MemoryRateLimitBackend(maxsize=settings.RATE_LIMIT_MEMORY_MAXSIZE)
+postgres_backend = PostgresRateLimitBackend(
+    idle_seconds=max(
+        limit.period
+        for limit in (
+            LOGIN_PER_IP,
+            LOGIN_PER_ACCOUNT,
+            PASSWORD_RECOVERY_PER_IP,
+            PASSWORD_RECOVERY_PER_ACCOUNT,
+        )
+    )
+)
+
+
+def get_rate_limit_backend() -> RateLimitBackend | None:
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return memory_backend
+    if settings.RATE_LIMIT_BACKEND == "postgres":
+        return postgres_backend
+    return None
@@ -1,16 +1,94 @@
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, TypeVar
 
 import jwt
 from passlib.context import CryptContext
 
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.models import PasswordHashStatus, UserPublic
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+T = TypeVar("T")
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
 
 
 ALGORITHM = "HS256"
 
+# Verified token payloads by token digest, each entry expires with its token
+token_cache: TTLCache[bytes, dict[str, Any]] = TTLCache(
+    maxsize=settings.TOKEN_CACHE_MAXSIZE,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+# Authenticated users by id, drop the entry of a user whenever the user changes
+authenticated_user_cache: TTLCache[uuid.UUID, UserPublic] = TTLCache(
+    maxsize=settings.AUTH_USER_CACHE_MAXSIZE, ttl=settings.AUTH_USER_CACHE_TTL_SECONDS
+)
+
+
+class PasswordHashStats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+
+    def on_submit(self) -> None:
+        with self.lock:
+            self.queued += 1
+
+    def on_start(self) -> None:
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+
+    def on_done(self) -> None:
+        with self.lock:
+            self.running -= 1
+            self.completed += 1
+
+
+password_hash_stats = PasswordHashStats()
+
+# bcrypt releases the GIL while hashing, so a few threads are enough to use
+# several cores, and bounding them keeps login bursts from starving other requests
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
+
+def get_password_hash_status() -> PasswordHashStatus:
+    with password_hash_stats.lock:
+        return PasswordHashStatus(
+            workers=settings.PASSWORD_HASH_WORKERS,
+            queued=password_hash_stats.queued,
+            running=password_hash_stats.running,
+            completed=password_hash_stats.completed,
+        )
+
+
+def _submit(fn: Callable[..., T], *args: Any) -> Future[T]:
+    def run() -> T:
+        password_hash_stats.on_start()
+        try:
+            return fn(*args)
+        finally:
+            password_hash_stats.on_done()
+
+    password_hash_stats.on_submit()
+    return password_hash_executor.submit(run)
+
 
 def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     expire = datetime.now(timezone.utc) + expires_delta
@@ -19,9 +97,55 @@ def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     return encoded_jwt
 
 
+def decode_token(token: str) -> dict[str, Any]:
+    """
+    Verify the signature and claims of a token, raising InvalidTokenError when
+    it's not valid.
+
+    Tokens are presented many times during their lifetime, the payload of a
+    verified token is cached until it expires to skip the HMAC verification.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        if "exp" in payload:
+            token_cache.set(key, payload, ttl=float(payload["exp"]) - time.time())
+    return payload
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return _submit(pwd_context.verify, plain_password, hashed_password).result()
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return _submit(pwd_context.hash, password).result()
+
+
+def get_password_hashes(passwords: Iterable[str]) -> Iterator[str]:
+    """
+    Hash many passwords, in order, in a pool of USER_IMPORT_HASH_WORKERS threads
+    of their own, so that logins don't queue behind them.
+    """
+    workers = settings.USER_IMPORT_HASH_WORKERS
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="password-hash-import"
+    ) as executor:
+        pending: deque[Future[str]] = deque()
+        for password in passwords:
+            # Keep the threads busy while the oldest hash is consumed
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(pwd_context.hash, password))
+        while pending:
+            yield pending.popleft().result()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(
+        _submit(pwd_context.verify, plain_password, hashed_password)
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await asyncio.wrap_future(_submit(pwd_context.hash, password))
@@ -0,0 +1,120 @@
+import logging
+import random
+import re
+import threading
+from collections import deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any
+
+from sqlalchemy import Engine
+
+from app.core.config import settings
+from app.models import SlowQuery, utcnow
+
+logger = logging.getLogger(__name__)
+
+# Slow statements of this process, the oldest ones are dropped first
+slow_queries: deque[SlowQuery] = deque(maxlen=settings.SLOW_QUERY_LOG_SIZE)
+slow_queries_lock = threading.Lock()
+
+# EXPLAIN runs in the background, so the request that ran the slow statement
+# doesn't wait for it a second time
+explain_executor = ThreadPoolExecutor(1, thread_name_prefix="explain")
+# Set while capturing a plan, the EXPLAIN statement itself is not recorded
+capturing_explain: ContextVar[bool] = ContextVar("capturing_explain", default=False)
+
+
+def normalize_statement(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+def get_parameter_types(parameters: Any, executemany: bool) -> dict[str, str]:
+    if executemany:
+        # The parameter sets of a statement run many times share their shape
+        parameters = parameters[0] if parameters else {}
+    if isinstance(parameters, Mapping):
+        return {str(name): type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, Sequence):
+        return {str(i): type(value).__name__ for i, value in enumerate(parameters)}
+    return {}
+
+
+# Keywords of statements that write, like a data-modifying CTE or SELECT INTO, or
+# that lock rows, like SELECT ... FOR UPDATE or FOR SHARE
+WRITE_KEYWORDS = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|INTO|SHARE)\b", re.I)
+
+
+def is_read_only(statement: str) -> bool:
+    """
+    Whether a statement can be explained. EXPLAIN ANALYZE runs the statement, so
+    only SELECT statements and CTEs without any writing or locking keyword are.
+    Such a keyword in a string or an identifier skips a safe statement too.
+    """
+    words = statement.split(maxsplit=1)
+    if not words or words[0].upper() not in ("SELECT", "WITH"):
+        return False
+    return not WRITE_KEYWORDS.search(statement)
+
+
+def capture_explain(
+    query: SlowQuery, statement: str, parameters: Any, db_engine: Engine
+) -> None:
+    # Imported here as the engines are instrumented when app.core.db is imported
+    from app.core.db import get_sync_engine
+
+    token = capturing_explain.set(True)
+    try:
+        # On the database that ran the statement, a replica or the primary
+        with get_sync_engine(db_engine).connect() as connection:
+            result = connection.exec_driver_sql(
+                f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+            )
+            query.explain = "\n".join(row[0] for row in result)
+            connection.rollback()
+    except Exception:
+        logger.exception("Capturing the plan of a slow query failed")
+    finally:
+        capturing_explain.reset(token)
+
+
+def record_slow_query(
+    *,
+    statement: str,
+    parameters: Any,
+    executemany: bool,
+    duration: float,
+    route: str | None,
+    db_engine: Engine,
+) -> None:
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    duration_ms = duration * 1000
+    if threshold is None or duration_ms < threshold or capturing_explain.get():
+        return
+    query = SlowQuery(
+        statement=normalize_statement(statement),
+        parameter_types=get_parameter_types(parameters, executemany),
+        executemany=executemany,
+        duration_ms=duration_ms,
+        route=route,
+        occurred_at=utcnow(),
+    )
+    with slow_queries_lock:
+        slow_queries.append(query)
+    logger.warning(
+        "Slow query (%.1f ms) in %s: %s", duration_ms, route, query.statement[:200]
+    )
+    if (
+        not executemany
+        and is_read_only(statement)
+        and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE
+    ):
+        explain_executor.submit(
+            capture_explain, query, statement, parameters, db_engine
+        )
+
+
+def get_slow_queries() -> list[SlowQuery]:
+    with slow_queries_lock:
+        return list(reversed(slow_queries))
@@ -1,10 +1,58 @@
 import uuid
+from collections.abc import Iterable, Mapping
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    ColumnElement,
+    Delete,
+    Double,
+    Row,
+    Update,
+    Uuid,
+    case,
+    cast,
+    column,
+    insert,
+    literal,
+    table,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import REGCLASS
+from sqlalchemy.sql.dml import ReturningInsert
+from sqlmodel import Session, col, delete, func, select
+from sqlmodel.sql.expression import Select, SelectOfScalar
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.security import (
+    authenticated_user_cache,
+    get_password_hash,
+    verify_password,
+)
+from app.models import (
+    ITEM_SEARCH_CONFIG,
+    CountMode,
+    Item,
+    ItemBatchResult,
+    ItemBatchUpdate,
+    ItemCreate,
+    ItemPublic,
+    ItemUpdate,
+    User,
+    UserCreate,
+    UserUpdate,
+    UserUpdateMe,
+    item_search_vector,
+)
+
+# Item count per owner, dropped by the functions that add or delete items of the
+# owner
+item_count_cache: TTLCache[uuid.UUID, int] = TTLCache(
+    maxsize=settings.COUNT_CACHE_MAXSIZE, ttl=settings.COUNT_CACHE_TTL_SECONDS
+)
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -17,7 +65,9 @@ def create_user(*, session: Session, user_create: UserCreate) -> User:
     return db_obj
 
 
-def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
+def update_user(
+    *, session: Session, db_user: User, user_in: UserUpdate | UserUpdateMe
+) -> Any:
     user_data = user_in.model_dump(exclude_unset=True)
     extra_data = {}
     if "password" in user_data:
@@ -28,12 +78,35 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
     session.add(db_user)
     session.commit()
     session.refresh(db_user)
+    authenticated_user_cache.delete(db_user.id)
     return db_user
 
 
+def update_password(*, session: Session, db_user: User, password: str) -> None:
+    db_user.hashed_password = get_password_hash(password)
+    session.add(db_user)
+    session.commit()
+    authenticated_user_cache.delete(db_user.id)
+
+
+def delete_owner_items_statement(owner_id: uuid.UUID) -> Delete:
+    return delete(Item).where(col(Item.owner_id) == owner_id)
+
+
+def delete_user(*, session: Session, db_user: User) -> None:
+    session.exec(delete_owner_items_statement(db_user.id))  # type: ignore[call-overload]
+    session.delete(db_user)
+    session.commit()
+    item_count_cache.delete(db_user.id)
+    authenticated_user_cache.delete(db_user.id)
+
+
+def user_by_email_statement(email: str) -> SelectOfScalar[User]:
+    return select(User).where(User.email == email)
+
+
 def get_user_by_email(*, session: Session, email: str) -> User | None:
-    statement = select(User).where(User.email == email)
-    session_user = session.exec(statement).first()
+    session_user = session.exec(user_by_email_statement(email)).first()
     return session_user
 
 
@@ -51,4 +124,274 @@ def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -
     session.add(db_item)
     session.commit()
     session.refresh(db_item)
+    item_count_cache.delete(owner_id)
     return db_item
+
+
+def update_item(*, session: Session, db_item: Item, item_in: ItemUpdate) -> Item:
+    db_item.sqlmodel_update(item_in.model_dump(exclude_unset=True))
+    session.add(db_item)
+    session.commit()
+    session.refresh(db_item)
+    return db_item
+
+
+def delete_item(*, session: Session, db_item: Item) -> None:
+    session.delete(db_item)
+    session.commit()
+    item_count_cache.delete(db_item.owner_id)
+
+
+def create_items_statement() -> ReturningInsert[tuple[Item]]:
+    # A single multi-row INSERT ... RETURNING, executed with new_item_rows
+    return insert(Item).returning(Item, sort_by_parameter_order=True)
+
+
+def new_item_rows(
+    items_in: list[ItemCreate], owner_id: uuid.UUID
+) -> list[dict[str, Any]]:
+    return [
+        Item.model_validate(item_in, update={"owner_id": owner_id}).model_dump()
+        for item_in in items_in
+    ]
+
+
+def created_item_results(items: Iterable[Item]) -> list[ItemBatchResult]:
+    return [
+        ItemBatchResult(
+            id=item.id, status_code=200, item=ItemPublic.model_validate(item)
+        )
+        for item in items
+    ]
+
+
+def create_items(
+    *, session: Session, items_in: list[ItemCreate], owner_id: uuid.UUID
+) -> list[ItemBatchResult]:
+    created = session.scalars(
+        create_items_statement(), new_item_rows(items_in, owner_id)
+    )
+    results = created_item_results(created)
+    session.commit()
+    item_count_cache.delete(owner_id)
+    return results
+
+
+def item_owners_statement(ids: list[uuid.UUID]) -> Select[tuple[uuid.UUID, uuid.UUID]]:
+    return select(Item.id, Item.owner_id).where(col(Item.id).in_(ids))
+
+
+def check_batch_access(
+    ids: list[uuid.UUID],
+    owners: Mapping[uuid.UUID, uuid.UUID],
+    owner_id: uuid.UUID | None,
+) -> dict[uuid.UUID, ItemBatchResult]:
+    """
+    Results of the items that can't be changed, by id, given the owner of each
+    existing item. Any item can be changed when owner_id is None.
+    """
+    errors = {}
+    for id in ids:
+        if id not in owners:
+            errors[id] = ItemBatchResult(
+                id=id, status_code=404, detail="Item not found"
+            )
+        elif owner_id is not None and owners[id] != owner_id:
+            errors[id] = ItemBatchResult(
+                id=id, status_code=400, detail="Not enough permissions"
+            )
+    return errors
+
+
+def update_items_statement(changes: Mapping[uuid.UUID, dict[str, Any]]) -> Update:
+    """
+    UPDATE of many items in one statement, given the fields set for each id.
+    Fields that a row doesn't set keep their value, and the version of every
+    row is incremented. It returns the updated items.
+    """
+    item_table = Item.__table__  # type: ignore[attr-defined]
+    fields = list(ItemUpdate.model_fields)
+    rows = values(
+        column("id", Uuid),
+        *(column(f"set_{name}", Boolean) for name in fields),
+        *(column(name, item_table.c[name].type) for name in fields),
+        name="batch",
+    ).data(
+        [
+            (
+                id,
+                *(name in fields_in for name in fields),
+                *(fields_in.get(name) for name in fields),
+            )
+            for id, fields_in in changes.items()
+        ]
+    )
+    return (
+        update(item_table)
+        .where(item_table.c.id == rows.c.id)
+        .values(
+            {
+                name: case(
+                    (rows.c[f"set_{name}"], rows.c[name]), else_=item_table.c[name]
+                )
+                for name in fields
+            }
+            | {"version": item_table.c.version + 1}
+        )
+        .returning(*(item_table.c[name] for name in ItemPublic.model_fields))
+    )
+
+
+def get_item_changes(
+    items_in: list[ItemBatchUpdate], errors: Mapping[uuid.UUID, ItemBatchResult]
+) -> dict[uuid.UUID, dict[str, Any]]:
+    # The fields to set of each item, the last update of an id repeated in the
+    # batch wins
+    changes: dict[uuid.UUID, dict[str, Any]] = {}
+    for item_in in items_in:
+        if item_in.id not in errors:
+            changes.setdefault(item_in.id, {}).update(
+                item_in.model_dump(exclude_unset=True, exclude={"id"})
+            )
+    return changes
+
+
+def updated_item_results(
+    items_in: list[ItemBatchUpdate],
+    errors: Mapping[uuid.UUID, ItemBatchResult],
+    rows: Iterable[Row[Any]],
+) -> list[ItemBatchResult]:
+    updated = {row.id: ItemPublic.model_validate(row._mapping) for row in rows}
+    return [
+        errors.get(item_in.id)
+        or ItemBatchResult(id=item_in.id, status_code=200, item=updated[item_in.id])
+        for item_in in items_in
+    ]
+
+
+def update_items(
+    *, session: Session, items_in: list[ItemBatchUpdate], owner_id: uuid.UUID | None
+) -> list[ItemBatchResult]:
+    ids = [item_in.id for item_in in items_in]
+    owners = dict(session.exec(item_owners_statement(ids)).all())
+    errors = check_batch_access(ids, owners, owner_id)
+    changes = get_item_changes(items_in, errors)
+    # One statement for all the rows, instead of an UPDATE per row that the
+    # version counter of the mapping requires
+    rows = []
+    if changes:
+        rows = session.exec(update_items_statement(changes)).all()  # type: ignore[call-overload]
+    results = updated_item_results(items_in, errors, rows)
+    session.commit()
+    return results
+
+
+def delete_items_statement(ids: list[uuid.UUID]) -> Delete:
+    return delete(Item).where(col(Item.id).in_(ids))
+
+
+def deleted_item_results(
+    ids: list[uuid.UUID],
+    errors: Mapping[uuid.UUID, ItemBatchResult],
+    owners: Mapping[uuid.UUID, uuid.UUID],
+) -> list[ItemBatchResult]:
+    # Called once the deletion is committed
+    for owner_id in {owners[id] for id in ids if id not in errors}:
+        item_count_cache.delete(owner_id)
+    return [
+        errors.get(id)
+        or ItemBatchResult(id=id, status_code=200, detail="Item deleted successfully")
+        for id in ids
+    ]
+
+
+def delete_items(
+    *, session: Session, ids: list[uuid.UUID], owner_id: uuid.UUID | None
+) -> list[ItemBatchResult]:
+    owners = dict(session.exec(item_owners_statement(ids)).all())
+    errors = check_batch_access(ids, owners, owner_id)
+    deleted_ids = [id for id in ids if id not in errors]
+    if deleted_ids:
+        session.exec(delete_items_statement(deleted_ids))  # type: ignore[call-overload]
+        session.commit()
+    return deleted_item_results(ids, errors, owners)
+
+
+def estimated_count_statement(table_name: str) -> SelectOfScalar[int]:
+    """
+    Row count estimate kept by Postgres in pg_class, updated by VACUUM and ANALYZE.
+
+    The estimate is -1 for tables that were never analyzed.
+    """
+    pg_class = table("pg_class", column("oid"), column("reltuples"))
+    return select(cast(pg_class.c.reltuples, BigInteger)).where(
+        pg_class.c.oid == cast(literal(f'"{table_name}"'), REGCLASS)
+    )
+
+
+def items_count_statement(owner_id: uuid.UUID | None) -> SelectOfScalar[int]:
+    statement = select(func.count()).select_from(Item)
+    if owner_id is not None:
+        statement = statement.where(Item.owner_id == owner_id)
+    return statement
+
+
+def count_items(
+    *, session: Session, owner_id: uuid.UUID | None, mode: CountMode
+) -> int | None:
+    if mode == "none":
+        return None
+    if mode == "estimated":
+        if owner_id is None:
+            estimate = session.exec(estimated_count_statement("item")).one()
+            if estimate >= 0:
+                return estimate
+        else:
+            cached = item_count_cache.get(owner_id)
+            if cached is not None:
+                return cached
+    count = session.exec(items_count_statement(owner_id)).one()
+    if owner_id is not None:
+        item_count_cache.set(owner_id, count)
+    return count
+
+
+def item_search_match(q: str) -> ColumnElement[bool]:
+    # websearch_to_tsquery accepts any user input, quoted phrases, "or" and "-"
+    query = func.websearch_to_tsquery(ITEM_SEARCH_CONFIG, q)
+    return item_search_vector.op("@@")(query)
+
+
+def item_search_rank(q: str) -> ColumnElement[float]:
+    # ts_rank is a real, as a double its text form round-trips through cursors
+    query = func.websearch_to_tsquery(ITEM_SEARCH_CONFIG, q)
+    return cast(func.ts_rank(item_search_vector, query), Double)
+
+
+def search_items_count_statement(
+    *, q: str, owner_id: uuid.UUID | None
+) -> SelectOfScalar[int]:
+    statement = select(func.count()).select_from(Item).where(item_search_match(q))
+    if owner_id is not None:
+        statement = statement.where(Item.owner_id == owner_id)
+    return statement
+
+
+def count_search_items(
+    *, session: Session, q: str, owner_id: uuid.UUID | None, mode: CountMode
+) -> int | None:
+    # There is no estimate of the matches of a search, it is counted exactly
+    if mode == "none":
+        return None
+    statement = search_items_count_statement(q=q, owner_id=owner_id)
+    return session.exec(statement).one()
+
+
+def count_users(*, session: Session, mode: CountMode) -> int | None:
+    if mode == "none":
+        return None
+    if mode == "estimated":
+        estimate = session.exec(estimated_count_statement("user")).one()
+        if estimate >= 0:
+            return estimate
+    return session.exec(select(func.count()).select_from(User)).one()
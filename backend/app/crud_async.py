@@ -0,0 +1,212 @@
+import uuid
+from typing import Any
+
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.security import (
+    authenticated_user_cache,
+    get_password_hash_async,
+    verify_password_async,
+)
+from app.crud import (
+    check_batch_access,
+    create_items_statement,
+    created_item_results,
+    delete_items_statement,
+    delete_owner_items_statement,
+    deleted_item_results,
+    estimated_count_statement,
+    get_item_changes,
+    item_count_cache,
+    item_owners_statement,
+    items_count_statement,
+    new_item_rows,
+    search_items_count_statement,
+    update_items_statement,
+    updated_item_results,
+    user_by_email_statement,
+)
+from app.models import (
+    CountMode,
+    Item,
+    ItemBatchResult,
+    ItemBatchUpdate,
+    ItemCreate,
+    ItemUpdate,
+    User,
+    UserCreate,
+    UserUpdate,
+    UserUpdateMe,
+)
+
+# Async counterparts of app.crud
+
+
+async def create_user(*, session: AsyncSession, user_create: UserCreate) -> User:
+    hashed_password = await get_password_hash_async(user_create.password)
+    db_obj = User.model_validate(
+        user_create, update={"hashed_password": hashed_password}
+    )
+    session.add(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
+    return db_obj
+
+
+async def update_user(
+    *, session: AsyncSession, db_user: User, user_in: UserUpdate | UserUpdateMe
+) -> Any:
+    user_data = user_in.model_dump(exclude_unset=True)
+    extra_data = {}
+    if "password" in user_data:
+        password = user_data["password"]
+        hashed_password = await get_password_hash_async(password)
+        extra_data["hashed_password"] = hashed_password
+    db_user.sqlmodel_update(user_data, update=extra_data)
+    session.add(db_user)
+    await session.commit()
+    await session.refresh(db_user)
+    authenticated_user_cache.delete(db_user.id)
+    return db_user
+
+
+async def update_password(
+    *, session: AsyncSession, db_user: User, password: str
+) -> None:
+    db_user.hashed_password = await get_password_hash_async(password)
+    session.add(db_user)
+    await session.commit()
+    authenticated_user_cache.delete(db_user.id)
+
+
+async def delete_user(*, session: AsyncSession, db_user: User) -> None:
+    await session.exec(delete_owner_items_statement(db_user.id))  # type: ignore[call-overload]
+    await session.delete(db_user)
+    await session.commit()
+    item_count_cache.delete(db_user.id)
+    authenticated_user_cache.delete(db_user.id)
+
+
+async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
+    session_user = (await session.exec(user_by_email_statement(email))).first()
+    return session_user
+
+
+async def authenticate(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await get_user_by_email(session=session, email=email)
+    if not db_user:
+        return None
+    if not await verify_password_async(password, db_user.hashed_password):
+        return None
+    return db_user
+
+
+async def create_item(
+    *, session: AsyncSession, item_in: ItemCreate, owner_id: uuid.UUID
+) -> Item:
+    db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
+    session.add(db_item)
+    await session.commit()
+    await session.refresh(db_item)
+    item_count_cache.delete(owner_id)
+    return db_item
+
+
+async def update_item(
+    *, session: AsyncSession, db_item: Item, item_in: ItemUpdate
+) -> Item:
+    db_item.sqlmodel_update(item_in.model_dump(exclude_unset=True))
+    session.add(db_item)
+    await session.commit()
+    await session.refresh(db_item)
+    return db_item
+
+
+async def delete_item(*, session: AsyncSession, db_item: Item) -> None:
+    await session.delete(db_item)
+    await session.commit()
+    item_count_cache.delete(db_item.owner_id)
+
+
+async def create_items(
+    *, session: AsyncSession, items_in: list[ItemCreate], owner_id: uuid.UUID
+) -> list[ItemBatchResult]:
+    created = await session.scalars(
+        create_items_statement(), new_item_rows(items_in, owner_id)
+    )
+    results = created_item_results(created)
+    await session.commit()
+    item_count_cache.delete(owner_id)
+    return results
+
+
+async def update_items(
+    *,
+    session: AsyncSession,
+    items_in: list[ItemBatchUpdate],
+    owner_id: uuid.UUID | None,
+) -> list[ItemBatchResult]:
+    ids = [item_in.id for item_in in items_in]
+    owners = dict((await session.exec(item_owners_statement(ids))).all())
+    errors = check_batch_access(ids, owners, owner_id)
+    changes = get_item_changes(items_in, errors)
+    rows = []
+    if changes:
+        rows = (await session.exec(update_items_statement(changes))).all()  # type: ignore[call-overload]
+    results = updated_item_results(items_in, errors, rows)
+    await session.commit()
+    return results
+
+
+async def delete_items(
+    *, session: AsyncSession, ids: list[uuid.UUID], owner_id: uuid.UUID | None
+) -> list[ItemBatchResult]:
+    owners = dict((await session.exec(item_owners_statement(ids))).all())
+    errors = check_batch_access(ids, owners, owner_id)
+    deleted_ids = [id for id in ids if id not in errors]
+    if deleted_ids:
+        await session.exec(delete_items_statement(deleted_ids))  # type: ignore[call-overload]
+        await session.commit()
+    return deleted_item_results(ids, errors, owners)
+
+
+async def count_items(
+    *, session: AsyncSession, owner_id: uuid.UUID | None, mode: CountMode
+) -> int | None:
+    if mode == "none":
+        return None
+    if mode == "estimated":
+        if owner_id is None:
+            estimate = (await session.exec(estimated_count_statement("item"))).one()
+            if estimate >= 0:
+                return estimate
+        else:
+            cached = item_count_cache.get(owner_id)
+            if cached is not None:
+                return cached
+    count = (await session.exec(items_count_statement(owner_id))).one()
+    if owner_id is not None:
+        item_count_cache.set(owner_id, count)
+    return count
+
+
+async def count_search_items(
+    *, session: AsyncSession, q: str, owner_id: uuid.UUID | None, mode: CountMode
+) -> int | None:
+    if mode == "none":
+        return None
+    statement = search_items_count_statement(q=q, owner_id=owner_id)
+    return (await session.exec(statement)).one()
+
+
+async def count_users(*, session: AsyncSession, mode: CountMode) -> int | None:
+    if mode == "none":
+        return None
+    if mode == "estimated":
+        estimate = (await session.exec(estimated_count_statement("user"))).one()
+        if estimate >= 0:
+            return estimate
+    return (await session.exec(select(func.count()).select_from(User))).one()
@@ -0,0 +1,155 @@
+import argparse
+import logging
+import queue
+import time
+from collections.abc import Generator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any
+
+from emails.backend import SMTPBackend  # type: ignore
+from sqlmodel import Session, col, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import OutboxEmail, utcnow
+from app.utils import build_email_message, get_smtp_options, render_outbox_email
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+
+
+class SMTPPool:
+    """
+    SMTP connections reused across emails, each connection is used by one thread
+    at a time and reconnects when the server closed it.
+    """
+
+    def __init__(self, smtp_options: dict[str, Any]) -> None:
+        self.smtp_options = smtp_options
+        self._idle: queue.LifoQueue[Any] = queue.LifoQueue()
+        self._backends: list[Any] = []
+
+    @contextmanager
+    def connection(self) -> Generator[Any, None, None]:
+        try:
+            backend = self._idle.get_nowait()
+        except queue.Empty:
+            backend = SMTPBackend(fail_silently=False, **self.smtp_options)
+            self._backends.append(backend)
+        try:
+            yield backend
+        except Exception:
+            # Don't reuse a connection in an unknown state
+            backend.close()
+            raise
+        finally:
+            self._idle.put(backend)
+
+    def close(self) -> None:
+        for backend in self._backends:
+            backend.close()
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(
+        seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    )
+
+
+def claim_emails(session: Session, limit: int) -> Sequence[OutboxEmail]:
+    # Rows locked by another worker are skipped, so workers can run side by side
+    statement = (
+        select(OutboxEmail)
+        .where(col(OutboxEmail.next_attempt_at) <= utcnow())
+        .where(col(OutboxEmail.attempts) < settings.EMAIL_MAX_ATTEMPTS)
+        .order_by(col(OutboxEmail.next_attempt_at))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return session.exec(statement).all()
+
+
+def deliver(pool: SMTPPool, email: OutboxEmail) -> str | None:
+    try:
+        message = build_email_message(
+            subject=email.subject, html_content=render_outbox_email(email)
+        )
+        with pool.connection() as smtp:
+            message.send(to=email.email_to, smtp=smtp)
+    except Exception as e:
+        return str(e) or type(e).__name__
+    return None
+
+
+def deliver_batch(
+    session: Session, pool: SMTPPool, executor: ThreadPoolExecutor
+) -> int:
+    """
+    Send the emails of the outbox that are due, up to a batch, and return how
+    many were attempted.
+
+    Sent emails are deleted and failed ones are scheduled for a retry, in one
+    transaction. An email sent before a failed commit is sent again. Emails that
+    failed EMAIL_MAX_ATTEMPTS times are deleted too, they're never retried.
+    """
+    emails = claim_emails(session, settings.EMAIL_WORKER_BATCH_SIZE)
+    errors = executor.map(lambda email: deliver(pool, email), emails)
+    for email, error in zip(emails, errors, strict=True):
+        if error is None:
+            session.delete(email)
+            continue
+        email.attempts += 1
+        if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            logger.error(
+                "Sending email %s failed %s times, giving up: %s",
+                email.id,
+                email.attempts,
+                error,
+            )
+            session.delete(email)
+            continue
+        email.last_error = error
+        email.next_attempt_at = utcnow() + retry_delay(email.attempts)
+        logger.warning(
+            "Sending email %s failed (attempt %s): %s", email.id, email.attempts, error
+        )
+    session.commit()
+    return len(emails)
+
+
+def run(*, once: bool = False) -> None:
+    pool = SMTPPool(get_smtp_options())
+    workers = settings.EMAIL_WORKER_SMTP_CONNECTIONS
+    try:
+        with ThreadPoolExecutor(workers, thread_name_prefix="email") as executor:
+            while True:
+                with Session(engine) as session:
+                    count = deliver_batch(session, pool, executor)
+                if count:
+                    logger.info("Processed %s emails", count)
+                if count < settings.EMAIL_WORKER_BATCH_SIZE:
+                    if once:
+                        return
+                    time.sleep(settings.EMAIL_WORKER_POLL_SECONDS)
+    finally:
+        pool.close()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Deliver the emails of the outbox")
+    parser.add_argument(
+        "--once", action="store_true", help="Exit when no email is left to send"
+    )
+    args = parser.parse_args()
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    logger.info("Starting email worker")
+    run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
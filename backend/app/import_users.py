@@ -0,0 +1,201 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import uuid
+from collections.abc import Iterator
+from itertools import islice
+from pathlib import Path
+from typing import IO, Any
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.core.db import engine
+from app.core.security import get_password_hashes
+from app.models import (
+    UserCreate,
+    UserImportConflict,
+    UserImportError,
+    UserImportFormat,
+    UsersImportResult,
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+STAGING_COLUMNS = (
+    "line",
+    "id",
+    "email",
+    "is_active",
+    "is_superuser",
+    "full_name",
+    "hashed_password",
+)
+
+CREATE_STAGING_TABLE = text(
+    "CREATE TEMPORARY TABLE user_import "
+    '(line integer, LIKE "user" INCLUDING DEFAULTS) ON COMMIT DROP'
+)
+
+# Rows of the staging table that were not inserted are email conflicts, either
+# with an existing user or with a previous line of the same file
+MERGE_STAGING_TABLE = text(
+    """
+    WITH inserted AS (
+        INSERT INTO "user" (id, email, is_active, is_superuser, full_name,
+                            hashed_password)
+        SELECT DISTINCT ON (email) id, email, is_active, is_superuser, full_name,
+               hashed_password
+        FROM user_import
+        ORDER BY email, line
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id
+    )
+    SELECT user_import.line, user_import.email
+    FROM user_import LEFT JOIN inserted ON inserted.id = user_import.id
+    WHERE inserted.id IS NULL
+    ORDER BY user_import.line
+    """
+)
+
+
+def read_records(
+    file: IO[str], format: UserImportFormat
+) -> Iterator[tuple[int, dict[str, Any] | str]]:
+    """
+    Yield the line number and the fields of each record of the file, or an error
+    message when the line can't be parsed.
+    """
+    if format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            # Let empty cells take the default value of their field
+            yield reader.line_num, {key: value for key, value in row.items() if value}
+        return
+    for line, content in enumerate(file, start=1):
+        if not content.strip():
+            continue
+        try:
+            record = json.loads(content)
+        except ValueError as e:
+            yield line, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line, "Expected a JSON object"
+            continue
+        yield line, record
+
+
+def parse_users(
+    file: IO[str], format: UserImportFormat, errors: list[UserImportError]
+) -> Iterator[tuple[int, UserCreate]]:
+    for line, record in read_records(file, format):
+        if isinstance(record, str):
+            errors.append(UserImportError(line=line, detail=record))
+            continue
+        try:
+            yield line, UserCreate.model_validate(record)
+        except ValidationError as e:
+            detail = "; ".join(
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            )
+            errors.append(UserImportError(line=line, detail=detail))
+
+
+def load_users(
+    *,
+    session: Session,
+    file: IO[str],
+    format: UserImportFormat,
+) -> UsersImportResult:
+    """
+    Create the users of a CSV or NDJSON file in one transaction.
+
+    Passwords are hashed in parallel by USER_IMPORT_HASH_WORKERS threads, and the
+    rows are loaded with COPY into a staging table that is merged into the user
+    table with a single statement. Existing emails are not updated, they are
+    reported as conflicts.
+    """
+    errors: list[UserImportError] = []
+    users = parse_users(file, format, errors)
+    session.execute(CREATE_STAGING_TABLE)
+    cursor = session.connection().connection.cursor()
+    copy_statement = f"COPY user_import ({', '.join(STAGING_COLUMNS)}) FROM STDIN"
+    while batch := list(islice(users, BATCH_SIZE)):
+        hashed_passwords = get_password_hashes(user.password for _, user in batch)
+        with cursor.copy(copy_statement) as copy:
+            for (line, user), hashed_password in zip(
+                batch, hashed_passwords, strict=True
+            ):
+                copy.write_row(
+                    (
+                        line,
+                        uuid.uuid4(),
+                        user.email,
+                        user.is_active,
+                        user.is_superuser,
+                        user.full_name,
+                        hashed_password,
+                    )
+                )
+    staged = session.execute(text("SELECT count(*) FROM user_import")).scalar_one()
+    conflicts = [
+        UserImportConflict(line=line, email=email)
+        for line, email in session.execute(MERGE_STAGING_TABLE)
+    ]
+    session.commit()
+    return UsersImportResult(
+        imported=staged - len(conflicts),
+        conflicts=conflicts,
+        errors=sorted(errors, key=lambda error: error.line),
+    )
+
+
+def load_users_from_file(
+    file: IO[bytes], format: UserImportFormat
+) -> UsersImportResult:
+    with (
+        Session(engine) as session,
+        io.TextIOWrapper(file, encoding="utf-8", newline="") as text_file,
+    ):
+        return load_users(session=session, file=text_file, format=format)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Import users from a file")
+    parser.add_argument("path", type=Path, help="CSV or NDJSON file of users")
+    parser.add_argument(
+        "--format",
+        choices=["csv", "ndjson"],
+        help="Format of the file, guessed from its extension by default",
+    )
+    args = parser.parse_args()
+    format: UserImportFormat = args.format or (
+        "ndjson" if args.path.suffix in (".ndjson", ".jsonl") else "csv"
+    )
+    logger.info("Importing users from %s", args.path)
+    with args.path.open("rb") as file:
+        result = load_users_from_file(file, format)
+    for conflict in result.conflicts:
+        logger.warning(
+            "Line %s: user with email %s already exists", conflict.line, conflict.email
+        )
+    for error in result.errors:
+        logger.warning("Line %s: %s", error.line, error.detail)
+    logger.info(
+        "Imported %s users, %s conflicts, %s errors",
+        result.imported,
+        len(result.conflicts),
+        len(result.errors),
+    )
+
+
+if __name__ == "__main__":
+    main()
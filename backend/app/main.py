@@ -1,10 +1,26 @@
+import asyncio
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager, suppress
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
+from sqlalchemy.orm.exc import StaleDataError
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.api.routes import metrics
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.db import async_engine, replicas
+from app.core.metrics import (
+    MetricsMiddleware,
+    mark_process_dead,
+    refresh_gauges_periodically,
+)
+from app.core.query_stats import QueryStatsMiddleware
+from app.utils import preload_email_templates
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,10 +30,30 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None, None]:
+    preload_email_templates()
+    tasks = [asyncio.create_task(refresh_gauges_periodically())]
+    if replicas.replicas:
+        tasks.append(asyncio.create_task(replicas.check_health_periodically()))
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    mark_process_dead()
+    # Async connections belong to the event loop that is closing
+    await async_engine.dispose()
+    for replica in replicas.replicas:
+        await replica.async_engine.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -30,4 +66,20 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+# Inside of the others, so that the metrics time the compression
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(_request: Request, _exc: StaleDataError) -> JSONResponse:
+    # The version of a row changed between reading and updating it
+    return JSONResponse(
+        status_code=409,
+        content={"detail": "The resource was modified by another request"},
+    )
+
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
+app.include_router(metrics.router)
@@ -1,6 +1,11 @@
 import uuid
+from datetime import datetime, timezone
+from typing import Any, Literal
 
 from pydantic import EmailStr
+from sqlalchemy import Column, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import declared_attr
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -43,17 +48,50 @@ class UpdatePassword(SQLModel):
 class User(UserBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
+    # Incremented by every UPDATE of the row, which only applies to the version
+    # it was loaded with
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
     items: list["Item"] = Relationship(back_populates="owner", cascade_delete=True)
 
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, Any]:
+        return {"version_id_col": cls.__table__.c.version}  # type: ignore[attr-defined]
+
 
 # Properties to return via API, id is always required
 class UserPublic(UserBase):
     id: uuid.UUID
+    version: int
+
+
+# How list endpoints count the total number of rows
+CountMode = Literal["exact", "estimated", "none"]
 
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
+
+
+# Formats of the files of the bulk user import
+UserImportFormat = Literal["csv", "ndjson"]
+
+
+class UserImportError(SQLModel):
+    line: int
+    detail: str
+
+
+class UserImportConflict(SQLModel):
+    line: int
+    email: str
+
+
+class UsersImportResult(SQLModel):
+    imported: int
+    conflicts: list[UserImportConflict]
+    errors: list[UserImportError]
 
 
 # Shared properties
@@ -74,23 +112,121 @@ class ItemUpdate(ItemBase):
 
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    # Serves the items of an owner in id order, for listing and cascade deletes
+    __table_args__ = (Index("ix_item_owner_id_id", "owner_id", "id"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     title: str = Field(max_length=255)
     owner_id: uuid.UUID = Field(
         foreign_key="user.id", nullable=False, ondelete="CASCADE"
     )
+    # Incremented by every UPDATE of the row, like User.version
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
     owner: User | None = Relationship(back_populates="items")
 
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, Any]:
+        return {"version_id_col": cls.__table__.c.version}  # type: ignore[attr-defined]
+
+
+# Text search configuration of the items, queries must use the same one
+ITEM_SEARCH_CONFIG = "english"
+
+# Words of the title and description of an item, the title ranking higher.
+# A trigger of the database keeps it up to date (see the e5d8a1f4c6b2
+# migration), it's added to the table after the mapping so that it's never
+# loaded or written with the items
+item_search_vector = Column("search_vector", TSVECTOR)
+Item.__table__.append_column(item_search_vector)  # type: ignore[attr-defined]
+Index("ix_item_search_vector", item_search_vector, postgresql_using="gin")
+
 
 # Properties to return via API, id is always required
 class ItemPublic(ItemBase):
     id: uuid.UUID
     owner_id: uuid.UUID
+    version: int
 
 
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
+
+
+# Formats of the item export
+ItemExportFormat = Literal["ndjson", "csv"]
+
+
+# Largest number of items changed by a batch request
+ITEMS_BATCH_MAX_SIZE = 1000
+
+
+class ItemsBatchCreate(SQLModel):
+    data: list[ItemCreate] = Field(min_length=1, max_length=ITEMS_BATCH_MAX_SIZE)
+
+
+class ItemBatchUpdate(ItemUpdate):
+    id: uuid.UUID
+
+
+class ItemsBatchUpdate(SQLModel):
+    data: list[ItemBatchUpdate] = Field(min_length=1, max_length=ITEMS_BATCH_MAX_SIZE)
+
+
+class ItemsBatchDelete(SQLModel):
+    ids: list[uuid.UUID] = Field(min_length=1, max_length=ITEMS_BATCH_MAX_SIZE)
+
+
+# Outcome of one row of a batch request, with the status code the single item
+# endpoint would have returned
+class ItemBatchResult(SQLModel):
+    id: uuid.UUID
+    status_code: int
+    detail: str | None = None
+    item: ItemPublic | None = None
+
+
+class ItemsBatchResults(SQLModel):
+    data: list[ItemBatchResult]
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# Email waiting for the email worker, added in the transaction of the change
+# that sends it, and deleted once delivered
+class OutboxEmail(SQLModel, table=True):
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str
+    # The email is rendered when it's sent, from a context without secrets like
+    # passwords or reset tokens, see app.utils.render_outbox_email
+    template_name: str = Field(max_length=255)
+    context: dict[str, Any] = Field(default_factory=dict, sa_type=JSONB)
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    next_attempt_at: datetime = Field(
+        default_factory=utcnow,
+        index=True,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    attempts: int = 0
+    last_error: str | None = None
+
+
+# Token bucket of a rate limit, see app.core.rate_limit
+class RateLimitBucket(SQLModel, table=True):
+    __tablename__ = "rate_limit_bucket"
+    # Not written to the WAL, the buckets are lost on a crash of Postgres
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key: str = Field(primary_key=True)
+    tokens: float
+    updated_at: datetime = Field(sa_type=DateTime(timezone=True))  # type: ignore
 
 
 # Generic message
@@ -112,3 +248,52 @@ class TokenPayload(SQLModel):
 class NewPassword(SQLModel):
     token: str
     new_password: str = Field(min_length=8, max_length=40)
+
+
+# Live statistics of a database connection pool
+class PoolStatus(SQLModel):
+    name: str
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkout_timeouts: int
+    checkout_wait_count: int
+    checkout_wait_seconds_sum: float
+    # Cumulative checkout count keyed by wait time upper bound, in seconds
+    checkout_wait_buckets: dict[str, int]
+
+
+# Load of the password hashing thread pool
+class PasswordHashStatus(SQLModel):
+    workers: int
+    queued: int
+    running: int
+    completed: int
+
+
+# Usage of an in-process cache
+class CacheStatus(SQLModel):
+    name: str
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+
+
+# Statement slower than SLOW_QUERY_THRESHOLD_MS, parameter values are not kept
+class SlowQuery(SQLModel):
+    statement: str
+    # Type name of each bind parameter, keyed by name or position
+    parameter_types: dict[str, str]
+    executemany: bool
+    duration_ms: float
+    route: str | None
+    occurred_at: datetime
+    explain: str | None = None
+
+
+class RuntimeStats(SQLModel):
+    db_pools: list[PoolStatus]
+    password_hashing: PasswordHashStatus
+    caches: list[CacheStatus]
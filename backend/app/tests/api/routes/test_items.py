@@ -1,10 +1,20 @@
+import csv
+import io
+import json
 import uuid
+from collections.abc import Callable
+from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
+from httpx import Response
 from sqlmodel import Session
 
+from app.api.export import EXPORT_COLUMNS
 from app.core.config import settings
+from app.models import Item
 from app.tests.utils.item import create_random_item
+from app.tests.utils.utils import random_lower_string
 
 
 def test_create_item(
@@ -40,6 +50,61 @@ def test_read_item(
     assert content["owner_id"] == str(item.owner_id)
 
 
+def test_read_item_not_modified(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    query_budget: Callable[[Response, int], None],
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+    assert r.json()["version"] == 1
+
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == etag
+    # Only the version of the row is read
+    query_budget(r, 1)
+
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": '"other"'})
+    assert r.status_code == 200
+    assert r.headers["etag"] == etag
+
+
+def test_read_item_not_modified_without_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers={**normal_user_token_headers, "If-None-Match": "*"},
+    )
+    assert r.status_code == 400
+
+
+def test_read_items_not_modified(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    r = client.post(url, headers=normal_user_token_headers, json={"title": "Polled"})
+    item_id = r.json()["id"]
+    r = client.get(url, headers=normal_user_token_headers)
+    etag = r.headers["etag"]
+    r = client.get(url, headers={**normal_user_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+
+    client.put(
+        f"{url}{item_id}", headers=normal_user_token_headers, json={"title": "Changed"}
+    )
+    r = client.get(url, headers={**normal_user_token_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+
+
 def test_read_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -97,6 +162,31 @@ def test_update_item(
     assert content["owner_id"] == str(item.owner_id)
 
 
+def test_update_item_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    etag = client.get(url, headers=superuser_token_headers).headers["etag"]
+
+    r = client.put(
+        url, headers={**superuser_token_headers, "If-Match": etag}, json={"title": "A"}
+    )
+    assert r.status_code == 200
+    assert r.json()["version"] == 2
+    new_etag = r.headers["etag"]
+    assert new_etag != etag
+
+    # The item changed since the first ETag was read
+    r = client.put(
+        url, headers={**superuser_token_headers, "If-Match": etag}, json={"title": "B"}
+    )
+    assert r.status_code == 412
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.json()["title"] == "A"
+    assert r.headers["etag"] == new_etag
+
+
 def test_update_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -162,3 +252,436 @@ def test_delete_item_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+
+
+def test_read_items_cursor_pagination(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    created_ids = set()
+    for i in range(3):
+        r = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"title": f"Paged {i}"},
+        )
+        created_ids.add(r.json()["id"])
+
+    seen_ids: list[str] = []
+    params: dict[str, str | int] = {"limit": 2}
+    while True:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            params=params,
+        )
+        assert response.status_code == 200
+        content = response.json()
+        assert len(content["data"]) <= 2
+        seen_ids.extend(item["id"] for item in content["data"])
+        if not content["next_cursor"]:
+            break
+        params["cursor"] = content["next_cursor"]
+
+    assert len(seen_ids) == len(set(seen_ids)) == content["count"]
+    assert created_ids <= set(seen_ids)
+    assert seen_ids == sorted(seen_ids)
+
+
+def test_read_items_fields(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    for i in range(3):
+        client.post(url, headers=normal_user_token_headers, json={"title": f"F {i}"})
+    full = client.get(url, headers=normal_user_token_headers, params={"limit": 2})
+
+    params: dict[str, str | int] = {"fields": "title, id", "limit": 2}
+    r = client.get(url, headers=normal_user_token_headers, params=params)
+    assert r.status_code == 200
+    content = r.json()
+    assert content["data"] == [
+        {"title": item["title"], "id": item["id"]} for item in full.json()["data"]
+    ]
+    assert content["count"] == full.json()["count"]
+    assert content["next_cursor"] == full.json()["next_cursor"]
+    # The representation differs from the one with every field
+    assert r.headers["etag"] != full.headers["etag"]
+
+    params["cursor"] = content["next_cursor"]
+    r = client.get(url, headers=normal_user_token_headers, params=params)
+    assert r.status_code == 200
+    assert all(item.keys() == {"id", "title"} for item in r.json()["data"])
+    assert r.json()["data"][0]["id"] > content["data"][-1]["id"]
+
+
+def test_read_items_invalid_fields(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    for fields in ("title,search_vector", "", ","):
+        r = client.get(
+            url, headers=normal_user_token_headers, params={"fields": fields}
+        )
+        assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid fields: ','"
+
+
+def test_read_items_invalid_cursor(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_items_count_modes(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    exact = client.get(url, headers=normal_user_token_headers).json()["count"]
+    assert isinstance(exact, int)
+
+    response = client.get(
+        url, headers=normal_user_token_headers, params={"count": "none"}
+    )
+    assert response.status_code == 200
+    assert response.json()["count"] is None
+
+    response = client.get(
+        url, headers=normal_user_token_headers, params={"count": "estimated"}
+    )
+    assert response.json()["count"] == exact
+
+    client.post(url, headers=normal_user_token_headers, json={"title": "Counted"})
+    response = client.get(
+        url, headers=normal_user_token_headers, params={"count": "estimated"}
+    )
+    assert response.json()["count"] == exact + 1
+
+
+def test_read_items_estimated_count_superuser(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"count": "estimated"},
+    )
+    assert response.status_code == 200
+    assert response.json()["count"] >= 0
+
+
+def test_search_items(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    superuser_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    word = random_lower_string()
+    url = f"{settings.API_V1_STR}/items/"
+    in_description = client.post(
+        url,
+        headers=normal_user_token_headers,
+        json={"title": "Other", "description": f"A penguin and a {word}"},
+    ).json()
+    in_title = client.post(
+        url, headers=normal_user_token_headers, json={"title": f"The {word}"}
+    ).json()
+    other_owner = create_random_item(db)
+    other_owner.title = word
+    db.add(other_owner)
+    db.commit()
+
+    response = client.get(
+        f"{url}search", headers=normal_user_token_headers, params={"q": word}
+    )
+    assert response.status_code == 200
+    content = response.json()
+    # Matches in the title rank first, items of other users are not searched
+    assert [item["id"] for item in content["data"]] == [
+        in_title["id"],
+        in_description["id"],
+    ]
+    assert content["count"] == 2
+    assert content["next_cursor"] is None
+
+    response = client.get(
+        f"{url}search", headers=superuser_token_headers, params={"q": word}
+    )
+    assert response.json()["count"] == 3
+
+    response = client.get(
+        f"{url}search",
+        headers=normal_user_token_headers,
+        params={"q": f"{word} -penguin"},
+    )
+    assert [item["id"] for item in response.json()["data"]] == [in_title["id"]]
+
+
+def test_search_items_cursor_pagination(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    word = random_lower_string()
+    created_ids = set()
+    for i in range(5):
+        # Repeating the word ranks the item higher, two items have the same rank
+        r = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"title": " ".join([word] * (i % 4 + 1))},
+        )
+        created_ids.add(r.json()["id"])
+
+    seen_ids: list[str] = []
+    params: dict[str, str | int] = {"q": word, "limit": 2}
+    while True:
+        response = client.get(
+            f"{settings.API_V1_STR}/items/search",
+            headers=normal_user_token_headers,
+            params=params,
+        )
+        assert response.status_code == 200
+        content = response.json()
+        seen_ids.extend(item["id"] for item in content["data"])
+        if not content["next_cursor"]:
+            break
+        params["cursor"] = content["next_cursor"]
+
+    assert len(seen_ids) == len(set(seen_ids)) == content["count"] == 5
+    assert set(seen_ids) == created_ids
+
+    response = client.get(
+        f"{settings.API_V1_STR}/items/search",
+        headers=normal_user_token_headers,
+        params={"q": word, "skip": 4},
+    )
+    assert [item["id"] for item in response.json()["data"]] == seen_ids[4:]
+
+
+def test_search_items_invalid_query(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/search"
+    response = client.get(url, headers=normal_user_token_headers, params={"q": ""})
+    assert response.status_code == 422
+    response = client.get(
+        url, headers=normal_user_token_headers, params={"q": "a", "cursor": "abc"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_create_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    data = {"data": [{"title": f"Batch {i}", "description": "Bulk"} for i in range(3)]}
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [result["status_code"] for result in results] == [200, 200, 200]
+    assert [result["item"]["title"] for result in results] == [
+        "Batch 0",
+        "Batch 1",
+        "Batch 2",
+    ]
+    for result in results:
+        r = client.get(
+            f"{settings.API_V1_STR}/items/{result['id']}",
+            headers=normal_user_token_headers,
+        )
+        assert r.json() == result["item"]
+
+
+def test_update_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Mine", "description": "Kept"},
+    )
+    own_item = r.json()
+    other_item = create_random_item(db)
+    missing_id = str(uuid.uuid4())
+    data = {
+        "data": [
+            {"id": own_item["id"], "title": "Renamed"},
+            {"id": str(other_item.id), "title": "Stolen"},
+            {"id": missing_id, "title": "Missing"},
+        ]
+    }
+    response = client.patch(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    updated, forbidden, missing = response.json()["data"]
+    assert updated["status_code"] == 200
+    assert updated["item"]["title"] == "Renamed"
+    assert updated["item"]["description"] == "Kept"
+    assert forbidden == {
+        "id": str(other_item.id),
+        "status_code": 400,
+        "detail": "Not enough permissions",
+        "item": None,
+    }
+    assert missing["id"] == missing_id
+    assert missing["status_code"] == 404
+
+    r = client.get(
+        f"{settings.API_V1_STR}/items/{own_item['id']}",
+        headers=normal_user_token_headers,
+    )
+    assert r.json()["title"] == "Renamed"
+    db.refresh(other_item)
+    assert other_item.title != "Stolen"
+
+
+def test_update_items_batch_query_budget(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    query_budget: Callable[[Response, int], None],
+) -> None:
+    items = [create_random_item(db) for _ in range(20)]
+    # Cache the authenticated user, so that the budget doesn't include it
+    client.get(f"{settings.API_V1_STR}/users/me", headers=superuser_token_headers)
+    # Rows of the batch set different fields, a null description included
+    data = {
+        "data": [
+            {"id": str(item.id), "title": f"Batch {i}"}
+            if i % 2
+            else {"id": str(item.id), "description": None}
+            for i, item in enumerate(items)
+        ]
+    }
+    r = client.patch(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert r.status_code == 200
+    # The access check and a single UPDATE for all the rows
+    query_budget(r, 2)
+    for i, (item, result) in enumerate(zip(items, r.json()["data"], strict=True)):
+        assert result["status_code"] == 200
+        assert result["item"]["version"] == item.version + 1
+        if i % 2:
+            assert result["item"]["title"] == f"Batch {i}"
+            assert result["item"]["description"] == item.description
+        else:
+            assert result["item"]["title"] == item.title
+            assert result["item"]["description"] is None
+
+
+def test_delete_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Doomed"},
+    )
+    own_item = r.json()
+    other_item = create_random_item(db)
+    response = client.request(
+        "DELETE",
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json={"ids": [own_item["id"], str(other_item.id)]},
+    )
+    assert response.status_code == 200
+    deleted, forbidden = response.json()["data"]
+    assert deleted["status_code"] == 200
+    assert deleted["detail"] == "Item deleted successfully"
+    assert forbidden["status_code"] == 400
+
+    r = client.get(
+        f"{settings.API_V1_STR}/items/{own_item['id']}",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 404
+    assert db.get(Item, other_item.id)
+
+
+def test_items_batch_empty(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/batch"
+    response = client.post(url, headers=normal_user_token_headers, json={"data": []})
+    assert response.status_code == 422
+    response = client.patch(url, headers=normal_user_token_headers, json={"data": []})
+    assert response.status_code == 422
+    response = client.request(
+        "DELETE", url, headers=normal_user_token_headers, json={"ids": []}
+    )
+    assert response.status_code == 422
+
+
+# The export streams from its own session
+@pytest.mark.commits
+def test_export_items_ndjson(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"title": "Exported", "description": "Streamed"},
+    )
+    other_item = create_random_item(db)
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=normal_user_token_headers)
+    own_items = [
+        {column: item[column] for column in EXPORT_COLUMNS} for item in r.json()["data"]
+    ]
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export", headers=normal_user_token_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert exported == sorted(own_items, key=lambda item: uuid.UUID(item["id"]))
+    assert str(other_item.id) not in {item["id"] for item in exported}
+
+
+# The export streams from its own session
+@pytest.mark.commits
+def test_export_items_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=superuser_token_headers,
+        params={"format": "csv"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = {row["id"]: row for row in csv.DictReader(io.StringIO(response.text))}
+    assert rows[str(item.id)] == {
+        "id": str(item.id),
+        "title": item.title,
+        "description": item.description,
+        "owner_id": str(item.owner_id),
+    }
+
+
+def test_read_items_fast_json_responses(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/"
+    fast = client.get(url, headers=superuser_token_headers, params={"limit": 5})
+    with patch("app.core.config.settings.FAST_JSON_RESPONSES", False):
+        slow = client.get(url, headers=superuser_token_headers, params={"limit": 5})
+    assert fast.status_code == slow.status_code == 200
+    assert fast.headers["content-type"] == slow.headers["content-type"]
+    assert fast.json() == slow.json()
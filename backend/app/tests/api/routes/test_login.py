@@ -1,11 +1,15 @@
+from collections.abc import Generator
 from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
 from app.core.config import settings
+from app.core.rate_limit import RateLimit, memory_backend
 from app.core.security import verify_password
-from app.models import User
+from app.models import OutboxEmail, User
+from app.tests.utils.utils import random_email
 from app.utils import generate_password_reset_token
 
 
@@ -30,6 +34,62 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+@pytest.fixture()
+def rate_limited() -> Generator[None, None, None]:
+    with patch("app.core.config.settings.RATE_LIMIT_BACKEND", "memory"):
+        yield
+    memory_backend.clear()
+
+
+@pytest.mark.usefixtures("rate_limited")
+def test_get_access_token_rate_limited_by_account(client: TestClient) -> None:
+    url = f"{settings.API_V1_STR}/login/access-token"
+    login_data = {"username": settings.FIRST_SUPERUSER, "password": "incorrect"}
+    limit = RateLimit(name="login-account", capacity=2, period=60)
+    with (
+        patch("app.api.deps.LOGIN_PER_ACCOUNT", limit),
+        patch("app.core.security.pwd_context.verify", return_value=False) as verify,
+    ):
+        for _ in range(2):
+            r = client.post(url, data=login_data)
+            assert r.status_code == 400
+        # Rejected before the password is checked, for any spelling of the email
+        login_data["username"] = login_data["username"].upper()
+        r = client.post(url, data=login_data)
+        assert r.status_code == 429
+        assert 0 < int(r.headers["retry-after"]) <= 30
+        assert verify.call_count == 2
+
+        # Other accounts can still log in
+        r = client.post(url, data={**login_data, "username": random_email()})
+        assert r.status_code == 400
+
+
+@pytest.mark.usefixtures("rate_limited")
+def test_get_access_token_rate_limited_by_ip(client: TestClient) -> None:
+    url = f"{settings.API_V1_STR}/login/access-token"
+    limit = RateLimit(name="login-ip", capacity=3, period=60)
+    with patch("app.api.deps.LOGIN_PER_IP", limit):
+        for _ in range(3):
+            r = client.post(url, data={"username": random_email(), "password": "x"})
+            assert r.status_code == 400
+        r = client.post(url, data={"username": random_email(), "password": "x"})
+        assert r.status_code == 429
+
+
+@pytest.mark.usefixtures("rate_limited")
+def test_recovery_password_rate_limited(client: TestClient) -> None:
+    email = random_email()
+    url = f"{settings.API_V1_STR}/password-recovery/{email}"
+    limit = RateLimit(name="password-recovery-account", capacity=1, period=3600)
+    with patch("app.api.deps.PASSWORD_RECOVERY_PER_ACCOUNT", limit):
+        r = client.post(url)
+        assert r.status_code == 404
+        r = client.post(url)
+        assert r.status_code == 429
+        assert int(r.headers["retry-after"]) == 3600
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -43,7 +103,7 @@ def test_use_access_token(
 
 
 def test_recovery_password(
-    client: TestClient, normal_user_token_headers: dict[str, str]
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
     with (
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
@@ -56,6 +116,10 @@ def test_recovery_password(
         )
         assert r.status_code == 200
         assert r.json() == {"message": "Password recovery email sent"}
+        outbox = db.exec(select(OutboxEmail).where(OutboxEmail.email_to == email)).all()
+        assert any(
+            "Password recovery" in outbox_email.subject for outbox_email in outbox
+        )
 
 
 def test_recovery_password_user_not_exits(
@@ -0,0 +1,26 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_read_metrics(client: TestClient) -> None:
+    client.get(f"{settings.API_V1_STR}/utils/health-check/")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert (
+        'http_requests_total{method="GET",route="utils-health_check",status="200"}'
+        in r.text
+    )
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="utils-health_check"}'
+        in r.text
+    )
+    assert 'db_pool_checked_out{pool="primary"}' in r.text
+    assert "password_hash_queued" in r.text
+
+
+def test_read_metrics_unmatched_route(client: TestClient) -> None:
+    client.get(f"{settings.API_V1_STR}/does-not-exist")
+    r = client.get("/metrics")
+    assert 'route="unmatched",status="404"' in r.text
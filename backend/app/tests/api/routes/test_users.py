@@ -1,13 +1,17 @@
+import json
 import uuid
+from collections.abc import Callable
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
+from httpx import Response
 from sqlmodel import Session, select
 
 from app import crud
 from app.core.config import settings
-from app.core.security import verify_password
-from app.models import User, UserCreate
+from app.core.security import authenticated_user_cache, verify_password
+from app.models import OutboxEmail, User, UserCreate
+from app.tests.utils.user import user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 
 
@@ -37,7 +41,6 @@ def test_create_user_new_email(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
     with (
-        patch("app.utils.send_email", return_value=None),
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
         patch("app.core.config.settings.SMTP_USER", "admin@example.com"),
     ):
@@ -54,6 +57,11 @@ def test_create_user_new_email(
         user = crud.get_user_by_email(session=db, email=username)
         assert user
         assert user.email == created_user["email"]
+        outbox = db.exec(
+            select(OutboxEmail).where(OutboxEmail.email_to == username)
+        ).one()
+        assert "New account" in outbox.subject
+        assert password not in str(outbox.context)
 
 
 def test_get_existing_user(
@@ -113,6 +121,17 @@ def test_get_existing_user_permissions_error(
     assert r.json() == {"detail": "The user doesn't have enough privileges"}
 
 
+def test_get_user_not_found(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/users/{uuid.uuid4()}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 404
+    assert r.json() == {"detail": "User not found"}
+
+
 def test_create_user_existing_username(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -146,6 +165,73 @@ def test_create_user_by_normal_user(
     assert r.status_code == 403
 
 
+def test_import_users(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    email = random_email()
+    rows = [
+        "email,password,full_name,is_superuser",
+        f"{email},{random_lower_string()},Imported User,false",
+        f"{random_email()},{random_lower_string()},,",
+        f"{settings.FIRST_SUPERUSER},{random_lower_string()},,",
+        f"{email},{random_lower_string()},Duplicate,",
+        f"not-an-email,{random_lower_string()},,",
+        f"{random_email()},short,,",
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=superuser_token_headers,
+        files={"file": ("users.csv", "\n".join(rows).encode(), "text/csv")},
+    )
+    assert 200 <= r.status_code < 300
+    result = r.json()
+    assert result["imported"] == 2
+    assert result["conflicts"] == [
+        {"line": 4, "email": settings.FIRST_SUPERUSER},
+        {"line": 5, "email": email},
+    ]
+    assert [error["line"] for error in result["errors"]] == [6, 7]
+    user = crud.get_user_by_email(session=db, email=email)
+    assert user
+    assert user.full_name == "Imported User"
+    assert not user.is_superuser
+    assert verify_password(rows[1].split(",")[1], user.hashed_password)
+
+
+def test_import_users_ndjson(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    email = random_email()
+    lines = [
+        json.dumps({"email": email, "password": random_lower_string()}),
+        "",
+        "not json",
+    ]
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=superuser_token_headers,
+        params={"format": "ndjson"},
+        files={"file": ("users.ndjson", "\n".join(lines).encode())},
+    )
+    assert 200 <= r.status_code < 300
+    result = r.json()
+    assert result["imported"] == 1
+    assert result["conflicts"] == []
+    assert [error["line"] for error in result["errors"]] == [3]
+    assert crud.get_user_by_email(session=db, email=email)
+
+
+def test_import_users_by_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/users/import",
+        headers=normal_user_token_headers,
+        files={"file": ("users.csv", b"email,password\n", "text/csv")},
+    )
+    assert r.status_code == 403
+
+
 def test_retrieve_users(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -168,6 +254,62 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_cursor_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(2):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 1},
+    )
+    first_page = r.json()
+    assert len(first_page["data"]) == 1
+    assert first_page["next_cursor"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 1, "cursor": first_page["next_cursor"]},
+    )
+    second_page = r.json()
+    assert len(second_page["data"]) == 1
+    assert second_page["data"][0]["id"] > first_page["data"][0]["id"]
+
+
+def test_retrieve_users_fields(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(2):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+    url = f"{settings.API_V1_STR}/users/"
+    full = client.get(url, headers=superuser_token_headers, params={"limit": 2})
+
+    r = client.get(
+        url, headers=superuser_token_headers, params={"limit": 2, "fields": "email"}
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["data"] == [{"email": user["email"]} for user in full.json()["data"]]
+    assert content["next_cursor"] == full.json()["next_cursor"]
+
+    with patch("app.core.config.settings.FAST_JSON_RESPONSES", False):
+        slow = client.get(
+            url, headers=superuser_token_headers, params={"limit": 2, "fields": "email"}
+        )
+    assert slow.json() == content
+
+    r = client.get(
+        url, headers=superuser_token_headers, params={"fields": "hashed_password"}
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid fields: hashed_password"
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -346,6 +488,45 @@ def test_update_user(
     assert user_db.full_name == "Updated_full_name"
 
 
+def test_update_user_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    etag = client.get(url, headers=superuser_token_headers).headers["etag"]
+    stale = {**superuser_token_headers, "If-Match": '"stale"'}
+    r = client.patch(url, headers=stale, json={"full_name": "Stale"})
+    assert r.status_code == 412
+
+    current = {**superuser_token_headers, "If-Match": etag}
+    r = client.patch(url, headers=current, json={"full_name": "Current"})
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Current"
+    assert r.headers["etag"] != etag
+
+
+def test_read_user_me_not_modified(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    query_budget: Callable[[Response, int], None],
+) -> None:
+    url = f"{settings.API_V1_STR}/users/me"
+    r = client.get(url, headers=normal_user_token_headers)
+    etag = r.headers["etag"]
+    r = client.get(url, headers={**normal_user_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    # The user is read from the cache of authenticated users
+    query_budget(r, 0)
+
+    client.patch(url, headers=normal_user_token_headers, json={"full_name": "New"})
+    r = client.get(url, headers={**normal_user_token_headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+
+
 def test_update_user_not_exists(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -484,3 +665,43 @@ def test_delete_user_without_privileges(
     )
     assert r.status_code == 403
     assert r.json()["detail"] == "The user doesn't have enough privileges"
+
+
+def test_read_user_me_uses_cached_user(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    username = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=username, password=password)
+    )
+    headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.json()["full_name"] is None
+    assert authenticated_user_cache.get(user.id)
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"full_name": "Cached Name", "is_active": False},
+    )
+    assert r.status_code == 200
+    assert authenticated_user_cache.get(user.id) is None
+
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+
+def test_retrieve_users_fast_json_responses(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/users/"
+    fast = client.get(url, headers=superuser_token_headers)
+    with patch("app.core.config.settings.FAST_JSON_RESPONSES", False):
+        slow = client.get(url, headers=superuser_token_headers)
+    assert fast.status_code == slow.status_code == 200
+    assert fast.json() == slow.json()
+    assert "hashed_password" not in fast.text
@@ -0,0 +1,56 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_read_runtime_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/stats/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    pools = r.json()["db_pools"]
+    primary = next(pool for pool in pools if pool["name"] == "primary")
+    assert primary["size"] == settings.POSTGRES_POOL_SIZE
+    assert primary["checkout_wait_count"] > 0
+    assert primary["checkout_wait_buckets"]["inf"] == primary["checkout_wait_count"]
+    password_hashing = r.json()["password_hashing"]
+    assert password_hashing["workers"] == settings.PASSWORD_HASH_WORKERS
+    assert password_hashing["completed"] > 0
+    caches = {cache["name"]: cache for cache in r.json()["caches"]}
+    assert caches["token"]["hits"] > 0
+
+
+def test_read_runtime_stats_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/stats/", headers=normal_user_token_headers
+    )
+    assert r.status_code == 403
+
+
+def test_read_slow_queries(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    with patch("app.core.config.settings.SLOW_QUERY_THRESHOLD_MS", 0.0):
+        r = client.get(f"{settings.API_V1_STR}/items/", headers=superuser_token_headers)
+    assert r.status_code == 200
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/slow-queries/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    routes = [query["route"] for query in r.json()]
+    assert "GET /api/v1/items/" in routes
+
+
+def test_read_slow_queries_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/slow-queries/", headers=normal_user_token_headers
+    )
+    assert r.status_code == 403
@@ -0,0 +1,64 @@
+import inspect
+from types import ModuleType
+from typing import Any
+
+import pytest
+from fastapi import APIRouter
+from fastapi.routing import APIRoute
+
+from app import crud, crud_async
+from app.api.routes import items, items_async, login, login_async, users, users_async
+
+
+def describe_routes(router: APIRouter) -> list[dict[str, Any]]:
+    # What clients see of each route, dependencies named without their suffix
+    routes = []
+    for route in router.routes:
+        assert isinstance(route, APIRoute)
+        dependant = route.dependant
+        routes.append(
+            {
+                "path": route.path,
+                "methods": route.methods,
+                "name": route.name,
+                "description": route.description,
+                "response_model": route.response_model,
+                "response_class": route.response_class,
+                "dependencies": [
+                    dependency.dependency.__name__.removesuffix("_async")  # type: ignore[union-attr]
+                    for dependency in route.dependencies
+                ],
+                "params": [
+                    (param.name, param.field_info.__class__.__name__)
+                    for param in (
+                        dependant.path_params
+                        + dependant.query_params
+                        + dependant.header_params
+                        + dependant.body_params
+                    )
+                ],
+            }
+        )
+    return routes
+
+
+@pytest.mark.parametrize(
+    "sync_module, async_module",
+    [(items, items_async), (login, login_async), (users, users_async)],
+)
+def test_async_routes_match_sync_routes(
+    sync_module: ModuleType, async_module: ModuleType
+) -> None:
+    assert describe_routes(async_module.router) == describe_routes(sync_module.router)
+
+
+def test_crud_async_matches_crud() -> None:
+    # Every function of crud running statements has an async counterpart
+    for name, function in inspect.getmembers(crud, inspect.isfunction):
+        if "session" not in inspect.signature(function).parameters:
+            continue
+        async_function = getattr(crud_async, name)
+        assert inspect.iscoroutinefunction(async_function), name
+        assert list(inspect.signature(async_function).parameters) == list(
+            inspect.signature(function).parameters
+        ), name
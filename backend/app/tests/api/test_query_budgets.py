@@ -0,0 +1,33 @@
+from collections.abc import Callable
+
+import pytest
+from fastapi.testclient import TestClient
+from httpx import Response
+
+from app.core.config import settings
+
+# Authentication is cached, so the budgets don't include loading the user
+BUDGETS = [
+    ("GET", "/items/", 2),
+    ("GET", "/items/?count=none", 1),
+    ("GET", "/users/me", 0),
+    ("POST", "/login/test-token", 0),
+    ("GET", "/utils/health-check/", 0),
+]
+
+
+@pytest.mark.parametrize("method, path, max_queries", BUDGETS)
+def test_query_budget(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    query_budget: Callable[[Response, int], None],
+    method: str,
+    path: str,
+    max_queries: int,
+) -> None:
+    url = f"{settings.API_V1_STR}{path}"
+    # Warm up the authentication caches
+    client.request(method, url, headers=normal_user_token_headers)
+    response = client.request(method, url, headers=normal_user_token_headers)
+    assert response.status_code == 200
+    query_budget(response, max_queries)
@@ -0,0 +1,25 @@
+import pytest
+from sqlmodel import Session, col, select
+
+from app.benchmarks.api import run
+from app.core.config import settings
+from app.models import User
+
+
+# Seeds and deletes its data from its own sessions
+@pytest.mark.commits
+def test_api_benchmark_reports_every_scenario(db: Session) -> None:
+    rate_limit_backend = settings.RATE_LIMIT_BACKEND
+    report = run(users=2, items=30, page_depths=[0, 20], requests=4, concurrency=2)
+    scenarios = report["scenarios"]
+    assert "read_items_skip_20" in scenarios
+    assert "signup" in scenarios
+    for result in scenarios.values():
+        assert result["requests"] == 4
+        assert result["errors"] == 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert result["throughput_rps"] > 0
+    # The rate limits are only disabled while the benchmark runs
+    assert settings.RATE_LIMIT_BACKEND == rate_limit_backend
+    statement = select(User).where(col(User.email).startswith("bench-"))
+    assert db.exec(statement).all() == []
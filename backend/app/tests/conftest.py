@@ -1,29 +1,142 @@
-from collections.abc import Generator
+import os
+import re
+import subprocess
+import sys
+from collections.abc import Callable, Generator
+from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
+from httpx import Response
+from sqlalchemy import Connection, create_engine, text
 from sqlmodel import Session, delete
 
 from app.core.config import settings
-from app.core.db import engine, init_db
-from app.main import app
-from app.models import Item, User
-from app.tests.utils.user import authentication_token_from_email
-from app.tests.utils.utils import get_superuser_token_headers
+
+# Before the engines are created: a database per pytest-xdist worker, so that
+# `pytest -n auto` workers don't see each other's rows, and cheap password hashes
+BASE_POSTGRES_DB = settings.POSTGRES_DB
+if worker := os.environ.get("PYTEST_XDIST_WORKER"):
+    settings.POSTGRES_DB = f"{BASE_POSTGRES_DB}_{worker}"
+settings.BCRYPT_ROUNDS = 4
+# Tests log in far more often than clients may, the rate limit tests enable it
+settings.RATE_LIMIT_BACKEND = "none"
+
+from app.api.deps import SessionDep, get_db, get_read_db  # noqa: E402
+from app.core import security  # noqa: E402
+from app.core.db import engine, init_db  # noqa: E402
+from app.crud import item_count_cache  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Item, OutboxEmail, RateLimitBucket, User  # noqa: E402
+from app.tests.utils.user import authentication_token_from_email  # noqa: E402
+from app.tests.utils.utils import get_superuser_token_headers  # noqa: E402
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers",
+        "commits: the test commits for real, the code under test opens its own "
+        "database sessions and only sees committed rows",
+    )
+
+
+def create_worker_database() -> None:
+    url = settings.SQLALCHEMY_DATABASE_URI
+    base_engine = create_engine(
+        str(url).replace(settings.POSTGRES_DB, BASE_POSTGRES_DB, 1),
+        isolation_level="AUTOCOMMIT",
+    )
+    with base_engine.connect() as connection:
+        exists = connection.scalar(
+            text("SELECT 1 FROM pg_database WHERE datname = :name"),
+            {"name": settings.POSTGRES_DB},
+        )
+        if not exists:
+            connection.execute(text(f'CREATE DATABASE "{settings.POSTGRES_DB}"'))
+    base_engine.dispose()
+    # In a subprocess, the logging setup of Alembic would disable the loggers of
+    # this one
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        cwd=Path(__file__).parents[2],
+        env={**os.environ, "POSTGRES_DB": settings.POSTGRES_DB},
+        check=True,
+    )
 
 
 @pytest.fixture(scope="session", autouse=True)
-def db() -> Generator[Session, None, None]:
+def database() -> Generator[None, None, None]:
+    if worker:
+        create_worker_database()
     with Session(engine) as session:
         init_db(session)
-        yield session
-        statement = delete(Item)
-        session.execute(statement)
-        statement = delete(User)
-        session.execute(statement)
+    yield
+    # Rows committed by the tests that can't run in a transaction
+    with Session(engine) as session:
+        session.execute(delete(Item))
+        session.execute(delete(User))
+        session.execute(delete(OutboxEmail))
+        session.execute(delete(RateLimitBucket))
         session.commit()
 
 
+def savepoint_session(connection: Connection) -> Session:
+    # Commits release a SAVEPOINT of the transaction of the connection
+    return Session(bind=connection, join_transaction_mode="create_savepoint")
+
+
+@pytest.fixture(autouse=True)
+def connection(
+    request: pytest.FixtureRequest,
+) -> Generator[Connection | None, None, None]:
+    """
+    Run the test in a transaction rolled back at its end, shared by the `db`
+    session and the sessions of the routes.
+
+    Async routes use their own connections, so with USE_ASYNC_DB and for tests
+    marked `commits`, rows are committed and deleted at the end of the session.
+    """
+    # Entries of rows that are about to be rolled back
+    security.authenticated_user_cache.clear()
+    item_count_cache.clear()
+    if settings.USE_ASYNC_DB or request.node.get_closest_marker("commits"):
+        yield None
+        return
+
+    with engine.connect() as test_connection:
+        transaction = test_connection.begin()
+
+        def get_test_db() -> Generator[Session, None, None]:
+            with savepoint_session(test_connection) as session:
+                yield session
+
+        # Reads meant for replicas share the session of the request, savepoints
+        # of two sessions of the connection can't be released in any order
+        def get_test_read_db(session: SessionDep) -> Session:
+            return session
+
+        app.dependency_overrides[get_db] = get_test_db
+        app.dependency_overrides[get_read_db] = get_test_read_db
+        try:
+            yield test_connection
+        finally:
+            del app.dependency_overrides[get_db]
+            del app.dependency_overrides[get_read_db]
+            transaction.rollback()
+
+
+@pytest.fixture()
+def db(connection: Connection | None) -> Generator[Session, None, None]:
+    session = Session(engine) if connection is None else savepoint_session(connection)
+    with session:
+        yield session
+
+
+@pytest.fixture(scope="session")
+def anyio_backend() -> str:
+    return "asyncio"
+
+
 @pytest.fixture(scope="module")
 def client() -> Generator[TestClient, None, None]:
     with TestClient(app) as c:
@@ -36,7 +149,31 @@ def superuser_token_headers(client: TestClient) -> dict[str, str]:
 
 
 @pytest.fixture(scope="module")
-def normal_user_token_headers(client: TestClient, db: Session) -> dict[str, str]:
-    return authentication_token_from_email(
-        client=client, email=settings.EMAIL_TEST_USER, db=db
-    )
+def normal_user_token_headers(client: TestClient) -> dict[str, str]:
+    # Committed, so that it outlives the transaction of each test
+    with Session(engine) as session:
+        return authentication_token_from_email(
+            client=client, email=settings.EMAIL_TEST_USER, db=session
+        )
+
+
+@pytest.fixture()
+def query_budget() -> Callable[[Response, int], None]:
+    """
+    Assert that the request of a response ran at most the given number of
+    statements, as reported by its Server-Timing header.
+    """
+
+    def check(response: Response, max_queries: int) -> None:
+        match = re.search(
+            r'db;.*desc="(\d+) queries"', response.headers["server-timing"]
+        )
+        assert match, "The response has no database timing"
+        count = int(match.group(1))
+        request = response.request
+        assert count <= max_queries, (
+            f"{request.method} {request.url.path} ran {count} queries, "
+            f"over its budget of {max_queries}"
+        )
+
+    return check
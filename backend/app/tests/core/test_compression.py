@@ -0,0 +1,176 @@
+import gzip
+import zlib
+from collections.abc import AsyncIterator
+
+import anyio
+import pytest
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.types import Message, Scope
+
+from app.core.compression import (
+    CompressionMiddleware,
+    brotli,
+    check_encodings,
+    coding_etag,
+    get_encoders,
+    select_encoding,
+    strip_etag_coding,
+    zstandard,
+)
+from app.core.config import settings
+
+
+def test_select_encoding() -> None:
+    available = ["zstd", "br", "gzip"]
+    assert select_encoding("gzip, deflate, br", available) == "br"
+    assert select_encoding("gzip, br;q=0", available) == "gzip"
+    assert select_encoding("*", available) == "zstd"
+    assert select_encoding("*, zstd;q=0", available) == "br"
+    assert select_encoding("identity", available) is None
+    assert select_encoding("", available) is None
+    assert select_encoding("GZIP;q=0.5", ["gzip"]) == "gzip"
+    assert select_encoding("gzip;q=nope", ["gzip"]) is None
+
+
+async def run(
+    response: Response,
+    accept_encoding: str = "gzip",
+    headers: dict[str, str] | None = None,
+) -> list[Message]:
+    app = CompressionMiddleware(response)
+    request_headers = {"accept-encoding": accept_encoding, **(headers or {})}
+    scope: Scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(k.encode(), v.encode()) for k, v in request_headers.items()],
+    }
+    messages: list[Message] = []
+    requests: list[Message] = [{"type": "http.request", "body": b""}]
+
+    async def receive() -> Message:
+        # Then wait for a disconnect that never comes
+        if not requests:
+            await anyio.Event().wait()
+        return requests.pop()
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+
+def get_headers(message: Message) -> dict[str, str]:
+    return {k.decode(): v.decode() for k, v in message["headers"]}
+
+
+@pytest.mark.anyio
+async def test_compress_response() -> None:
+    content = "x" * settings.COMPRESSION_MIN_SIZE
+    start, body = await run(PlainTextResponse(content))
+    headers = get_headers(start)
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(body["body"])
+    assert gzip.decompress(body["body"]).decode() == content
+
+
+def test_coding_etag() -> None:
+    assert coding_etag('"abc-1"', "gzip") == '"abc-1-gzip"'
+    assert coding_etag('W/"abc-1"', "br") == 'W/"abc-1-br"'
+    assert strip_etag_coding('"abc-1-gzip"') == '"abc-1"'
+    assert strip_etag_coding('"abc-1"') == '"abc-1"'
+
+
+@pytest.mark.anyio
+async def test_compressed_response_etag() -> None:
+    content = "x" * settings.COMPRESSION_MIN_SIZE
+    response = PlainTextResponse(content, headers={"ETag": '"abc"'})
+    start, _ = await run(response)
+    assert get_headers(start)["etag"] == '"abc-gzip"'
+
+    start, _ = await run(response, "identity")
+    assert get_headers(start)["etag"] == '"abc"'
+
+    # Not modified responses tag the representation the client has
+    not_modified = Response(status_code=304, headers={"ETag": '"abc"'})
+    start, _ = await run(not_modified, headers={"if-none-match": '"abc-gzip"'})
+    assert get_headers(start)["etag"] == '"abc-gzip"'
+    start, _ = await run(not_modified, headers={"if-none-match": '"abc"'})
+    assert get_headers(start)["etag"] == '"abc"'
+
+
+def test_check_encodings() -> None:
+    check_encodings(["gzip"])
+    missing = {"br": "brotli", "zstd": "zstandard"}
+    for encoding, package in missing.items():
+        if encoding not in get_encoders():
+            with pytest.raises(RuntimeError, match=package):
+                check_encodings([encoding, "gzip"])
+
+
+def decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == "br":
+        return bytes(brotli.decompress(data))  # type: ignore[union-attr]
+    if encoding == "zstd":
+        decompressor = zstandard.ZstdDecompressor().decompressobj()  # type: ignore[union-attr]
+        return bytes(decompressor.decompress(data))
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_encoders(encoding: str) -> None:
+    if encoding not in get_encoders():
+        pytest.skip(f"The package of {encoding} is not installed")
+    encoder = get_encoders()[encoding]()
+    content = b"id,title\n" * 200
+    # Flushed data can be decoded before the rest of the content
+    flushed = encoder.compress(content[:100]) + encoder.flush()
+    data = flushed + encoder.compress(content[100:]) + encoder.finish()
+    assert decompress(encoding, data) == content
+
+
+@pytest.mark.anyio
+async def test_compress_response_skipped() -> None:
+    small = "x" * (settings.COMPRESSION_MIN_SIZE - 1)
+    large = "x" * settings.COMPRESSION_MIN_SIZE
+    for response, accept_encoding in [
+        (PlainTextResponse(small), "gzip"),
+        (PlainTextResponse(large), "identity"),
+        (Response(large, media_type="image/png"), "gzip"),
+        (Response(large, headers={"Content-Encoding": "br"}), "gzip"),
+    ]:
+        start, body = await run(response, accept_encoding)
+        assert get_headers(start).get("content-encoding") != "gzip"
+        assert body["body"] == response.body
+
+
+@pytest.mark.anyio
+async def test_compress_streaming_response() -> None:
+    chunks = ["id,title\n", "1,first\n", "2,second\n"]
+
+    async def stream() -> AsyncIterator[str]:
+        for chunk in chunks:
+            yield chunk
+
+    start, *bodies = await run(StreamingResponse(stream(), media_type="text/csv"))
+    assert get_headers(start)["content-encoding"] == "gzip"
+    assert "content-length" not in get_headers(start)
+    # Each chunk can be decoded as soon as it's received, nothing is buffered
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    decoded = [decompressor.decompress(body["body"]).decode() for body in bodies]
+    assert decoded == [*chunks, ""]
+    assert decompressor.eof
+    assert [body.get("more_body") for body in bodies] == [True, True, True, False]
+
+
+def test_compress_api_response(client: TestClient) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/openapi.json", headers={"Accept-Encoding": "gzip"}
+    )
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.json()["openapi"]
+    # Raw responses of the test client are decoded already
+    assert int(r.headers["content-length"]) < len(r.content)
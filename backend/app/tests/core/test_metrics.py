@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Each worker writes its metrics to files of the shared directory, a worker
+# process is simulated by a new interpreter
+WORKER = """
+from app.core.metrics import REQUESTS, REQUESTS_IN_PROGRESS, refresh_gauges
+REQUESTS.labels("GET", "items-read_items", "200").inc()
+REQUESTS_IN_PROGRESS.labels("GET").inc()
+refresh_gauges()
+"""
+
+SCRAPE = """
+from app.core.metrics import generate_metrics
+print(generate_metrics().decode())
+"""
+
+
+def run_worker(code: str, multiproc_dir: Path) -> str:
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir)}
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout
+
+
+def test_metrics_are_aggregated_across_processes(tmp_path: Path) -> None:
+    run_worker(WORKER, tmp_path)
+    run_worker(WORKER, tmp_path)
+    output = run_worker(SCRAPE, tmp_path)
+    assert (
+        'http_requests_total{method="GET",route="items-read_items",status="200"} 2.0'
+        in output
+    )
+    assert 'db_pool_size{pool="primary"}' in output
+
+
+def test_checkout_timeouts_are_counted(tmp_path: Path) -> None:
+    worker = """
+from app.core.db import PoolStats, pool_stats
+from app.core.metrics import refresh_gauges
+stats = pool_stats.setdefault("primary", PoolStats())
+stats.observe_timeout()
+refresh_gauges()
+stats.observe_timeout()
+refresh_gauges()
+refresh_gauges()
+"""
+    run_worker(worker, tmp_path)
+    run_worker(worker, tmp_path)
+    output = run_worker(SCRAPE, tmp_path)
+    assert 'db_pool_checkout_timeouts_total{pool="primary"} 4.0' in output
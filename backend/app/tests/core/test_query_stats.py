@@ -0,0 +1,35 @@
+import logging
+
+import pytest
+from sqlmodel import Session, select
+
+from app.core.query_stats import QueryStats, check_query_stats, current_query_stats
+from app.models import User
+
+
+def test_query_stats_count_statements(db: Session) -> None:
+    stats = QueryStats()
+    token = current_query_stats.set(stats)
+    try:
+        for _ in range(3):
+            db.exec(select(User).where(User.email == "nobody@example.com")).first()
+    finally:
+        current_query_stats.reset(token)
+    assert stats.count == 3
+    assert stats.duration > 0
+    assert list(stats.statements.values()) == [3]
+    assert stats.server_timing().endswith('desc="3 queries"')
+
+
+def test_check_query_stats_warns_about_repeated_queries(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    stats = QueryStats(count=30)
+    stats.statements["SELECT item.id FROM item WHERE item.id = %(id)s"] = 25
+    stats.statements["SELECT 1"] = 5
+    with caplog.at_level(logging.WARNING, logger="app.core.query_stats"):
+        check_query_stats(stats, "GET /api/v1/items/")
+    messages = [record.getMessage() for record in caplog.records]
+    assert "GET /api/v1/items/ ran 30 queries, over the budget of 20" in messages
+    assert any("25 times, possible N+1: SELECT item.id" in m for m in messages)
+    assert any("5 times, possible N+1: SELECT 1" in m for m in messages)
@@ -0,0 +1,58 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, col, delete
+
+from app.core.db import engine
+from app.core.rate_limit import (
+    MemoryRateLimitBackend,
+    PostgresRateLimitBackend,
+    RateLimit,
+    RateLimitBackend,
+)
+from app.models import RateLimitBucket
+
+LIMIT = RateLimit(name="test", capacity=3, period=60)
+
+
+def test_memory_backend() -> None:
+    backend = MemoryRateLimitBackend(maxsize=10)
+    with patch("app.core.rate_limit.time.monotonic", return_value=1000.0) as clock:
+        assert [backend.acquire("a", LIMIT) for _ in range(3)] == [0, 0, 0]
+        # A token is added every 20 seconds
+        assert backend.acquire("a", LIMIT) == pytest.approx(20)
+        assert backend.acquire("b", LIMIT) == 0
+        clock.return_value = 1015.0
+        assert backend.acquire("a", LIMIT) == pytest.approx(5)
+        clock.return_value = 1020.0
+        assert backend.acquire("a", LIMIT) == 0
+        assert backend.acquire("a", LIMIT) == pytest.approx(20)
+        # The bucket doesn't hold more than its capacity
+        clock.return_value = 5000.0
+        assert [backend.acquire("a", LIMIT) for _ in range(4)][-1] > 0
+
+
+def test_memory_backend_maxsize() -> None:
+    backend = MemoryRateLimitBackend(maxsize=2)
+    for key in ("a", "b", "c"):
+        backend.acquire(key, LIMIT)
+    assert list(backend._buckets) == ["b", "c"]
+
+
+def test_postgres_backend() -> None:
+    backend: RateLimitBackend = PostgresRateLimitBackend(idle_seconds=3600)
+    key = f"test:{uuid.uuid4()}"
+    try:
+        assert [backend.acquire(key, LIMIT) for _ in range(3)] == [0, 0, 0]
+        wait = backend.acquire(key, LIMIT)
+        assert 19 < wait <= 20
+        # Rejected requests don't take tokens
+        assert 19 < backend.acquire(key, LIMIT) <= wait
+        assert backend.acquire(f"{key}:other", LIMIT) == 0
+    finally:
+        with Session(engine) as session:
+            session.execute(
+                delete(RateLimitBucket).where(col(RateLimitBucket.key).startswith(key))
+            )
+            session.commit()
@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+import pytest
+from jwt.exceptions import InvalidTokenError
+
+from app.core.security import (
+    create_access_token,
+    decode_token,
+    get_password_hash,
+    get_password_hash_async,
+    get_password_hashes,
+    password_hash_stats,
+    pwd_context,
+    token_cache,
+    verify_password,
+    verify_password_async,
+)
+
+
+def test_password_hashing_runs_in_pool() -> None:
+    completed = password_hash_stats.completed
+    hashed_password = get_password_hash("secret-password")
+    assert verify_password("secret-password", hashed_password)
+    assert not verify_password("wrong-password", hashed_password)
+    assert password_hash_stats.completed == completed + 3
+    assert password_hash_stats.queued == password_hash_stats.running == 0
+
+
+def test_password_hashes_run_apart_from_logins() -> None:
+    passwords = [f"secret-password-{i}" for i in range(5)]
+    completed = password_hash_stats.completed
+    hashed_passwords = list(get_password_hashes(passwords))
+    # The pool of the logins is left alone
+    assert password_hash_stats.completed == completed
+    for password, hashed_password in zip(passwords, hashed_passwords, strict=True):
+        assert pwd_context.verify(password, hashed_password)
+
+
+@pytest.mark.anyio
+async def test_password_hashing_async() -> None:
+    hashed_password = await get_password_hash_async("secret-password")
+    assert await verify_password_async("secret-password", hashed_password)
+    assert not await verify_password_async("wrong-password", hashed_password)
+
+
+def test_decode_token_caches_verified_tokens() -> None:
+    token = create_access_token("subject", expires_delta=timedelta(minutes=5))
+    hits, misses = token_cache.hits, token_cache.misses
+    assert decode_token(token)["sub"] == "subject"
+    assert decode_token(token)["sub"] == "subject"
+    assert (token_cache.hits, token_cache.misses) == (hits + 1, misses + 1)
+
+
+def test_decode_token_rejects_invalid_tokens() -> None:
+    token = create_access_token("subject", expires_delta=timedelta(minutes=-5))
+    with pytest.raises(InvalidTokenError):
+        decode_token(token)
+    with pytest.raises(InvalidTokenError):
+        decode_token(token)
+    with pytest.raises(InvalidTokenError):
+        decode_token("invalid")
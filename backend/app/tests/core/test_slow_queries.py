@@ -0,0 +1,68 @@
+from unittest.mock import patch
+
+from sqlmodel import Session, col, select, update
+
+from app.core.db import async_engine, engine, get_sync_engine
+from app.core.slow_queries import explain_executor, get_slow_queries, is_read_only
+from app.models import User
+
+
+def wait_for_explain() -> None:
+    # The executor has a single thread, so earlier captures are done after this
+    explain_executor.submit(lambda: None).result()
+
+
+def test_slow_queries_are_recorded_with_their_plan(db: Session) -> None:
+    with (
+        patch("app.core.config.settings.SLOW_QUERY_THRESHOLD_MS", 0.0),
+        patch("app.core.config.settings.SLOW_QUERY_EXPLAIN_RATE", 1.0),
+    ):
+        db.exec(select(User).where(User.email == "slow@example.com")).first()
+        wait_for_explain()
+    query = next(q for q in get_slow_queries() if 'FROM "user"' in q.statement)
+    assert "\n" not in query.statement
+    assert list(query.parameter_types.values()) == ["str"]
+    assert "slow@example.com" not in query.model_dump_json(exclude={"explain"})
+    assert query.route is None
+    assert query.duration_ms > 0
+    assert query.explain
+    assert "actual time=" in query.explain
+
+
+def test_slow_writes_are_not_explained(db: Session) -> None:
+    with (
+        patch("app.core.config.settings.SLOW_QUERY_THRESHOLD_MS", 0.0),
+        patch("app.core.config.settings.SLOW_QUERY_EXPLAIN_RATE", 1.0),
+    ):
+        db.exec(  # type: ignore[call-overload]
+            update(User)
+            .where(col(User.email) == "slow@example.com")
+            .values(full_name="Slow")
+        )
+        db.rollback()
+        wait_for_explain()
+    query = next(q for q in get_slow_queries() if q.statement.startswith("UPDATE"))
+    assert query.explain is None
+
+
+def test_slow_queries_are_disabled_by_default(db: Session) -> None:
+    count = len(get_slow_queries())
+    db.exec(select(User).where(User.email == "slow@example.com")).first()
+    assert len(get_slow_queries()) == count
+
+
+def test_only_reads_are_explained() -> None:
+    assert is_read_only('SELECT * FROM "user" WHERE "user".updated_at > %(d)s')
+    assert is_read_only("WITH recent AS (SELECT 1) SELECT * FROM recent")
+    assert not is_read_only('SELECT * FROM "user" FOR UPDATE')
+    assert not is_read_only("SELECT * FROM item FOR NO KEY UPDATE SKIP LOCKED")
+    assert not is_read_only("SELECT * FROM item FOR KEY SHARE")
+    assert not is_read_only("SELECT * INTO copy FROM item")
+    assert not is_read_only("WITH gone AS (DELETE FROM item RETURNING id) SELECT 1")
+    assert not is_read_only("UPDATE item SET title = 'x'")
+
+
+def test_plans_are_captured_on_the_database_of_the_query() -> None:
+    assert get_sync_engine(engine) is engine
+    # The sync engine of an async engine can't connect outside the event loop
+    assert get_sync_engine(async_engine.sync_engine) is engine
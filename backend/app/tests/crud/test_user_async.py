@@ -0,0 +1,65 @@
+from collections.abc import AsyncGenerator
+
+import pytest
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud_async
+from app.core.db import async_engine
+from app.core.security import verify_password
+from app.models import UserCreate, UserUpdate
+from app.tests.utils.utils import random_email, random_lower_string
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def async_db() -> AsyncGenerator[AsyncSession, None]:
+    # Rolled back at the end of the test, commits release a SAVEPOINT
+    async with async_engine.connect() as connection:
+        transaction = await connection.begin()
+        async with AsyncSession(
+            bind=connection,
+            expire_on_commit=False,
+            join_transaction_mode="create_savepoint",
+        ) as session:
+            yield session
+        await transaction.rollback()
+    # Pooled connections are bound to this test's event loop
+    await async_engine.dispose()
+
+
+async def test_create_user(async_db: AsyncSession) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = await crud_async.create_user(session=async_db, user_create=user_in)
+    assert user.email == email
+    assert hasattr(user, "hashed_password")
+
+
+async def test_authenticate_user(async_db: AsyncSession) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = await crud_async.create_user(session=async_db, user_create=user_in)
+    authenticated_user = await crud_async.authenticate(
+        session=async_db, email=email, password=password
+    )
+    assert authenticated_user
+    assert user.email == authenticated_user.email
+
+
+async def test_not_authenticate_user(async_db: AsyncSession) -> None:
+    user = await crud_async.authenticate(
+        session=async_db, email=random_email(), password=random_lower_string()
+    )
+    assert user is None
+
+
+async def test_update_user(async_db: AsyncSession) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = await crud_async.create_user(session=async_db, user_create=user_in)
+    new_password = random_lower_string()
+    user_in_update = UserUpdate(password=new_password)
+    await crud_async.update_user(session=async_db, db_user=user, user_in=user_in_update)
+    assert verify_password(new_password, user.hashed_password)
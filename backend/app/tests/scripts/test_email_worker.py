@@ -0,0 +1,104 @@
+from collections.abc import Generator
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, col, select
+
+from app.email_worker import retry_delay, run
+from app.models import OutboxEmail, utcnow
+from app.tests.utils.smtp import SMTPStandIn, smtp_stand_in
+from app.tests.utils.utils import random_email
+from app.utils import queue_email
+
+# The worker claims the emails from its own sessions
+pytestmark = pytest.mark.commits
+
+
+@pytest.fixture()
+def smtp_server() -> Generator[SMTPStandIn, None, None]:
+    with (
+        smtp_stand_in() as stand_in,
+        patch("app.core.config.settings.SMTP_HOST", stand_in.host),
+        patch("app.core.config.settings.SMTP_PORT", stand_in.port),
+        patch("app.core.config.settings.SMTP_TLS", False),
+        patch("app.core.config.settings.SMTP_USER", None),
+        patch("app.core.config.settings.SMTP_PASSWORD", None),
+    ):
+        yield stand_in
+
+
+def test_email_worker_delivers_outbox(db: Session, smtp_server: SMTPStandIn) -> None:
+    emails_to = [random_email() for _ in range(5)]
+    for email_to in emails_to:
+        queue_email(
+            session=db,
+            email_to=email_to,
+            subject="Hello",
+            template_name="test_email.html",
+            context={"project_name": "Project", "email": email_to},
+        )
+    db.commit()
+
+    with patch("app.core.config.settings.EMAIL_WORKER_SMTP_CONNECTIONS", 2):
+        run(once=True)
+
+    received = {
+        address: email for email in smtp_server.received for address in email.rcpt_to
+    }
+    for email_to in emails_to:
+        assert "Subject: Hello" in received[email_to].data
+    # Connections are reused across emails
+    assert smtp_server.connections <= 2
+    statement = select(OutboxEmail).where(col(OutboxEmail.email_to).in_(emails_to))
+    assert db.exec(statement).all() == []
+
+
+def test_email_worker_retries_failed_emails(
+    db: Session, smtp_server: SMTPStandIn
+) -> None:
+    email_to = f"reject-{random_email()}"
+    queue_email(
+        session=db,
+        email_to=email_to,
+        subject="Hello",
+        template_name="test_email.html",
+        context={"project_name": "Project", "email": email_to},
+    )
+    db.commit()
+
+    run(once=True)
+
+    email = db.exec(select(OutboxEmail).where(OutboxEmail.email_to == email_to)).one()
+    db.refresh(email)
+    assert email.attempts == 1
+    assert email.last_error
+    assert email.next_attempt_at > utcnow() + timedelta(seconds=20)
+    assert all(email_to not in received.rcpt_to for received in smtp_server.received)
+    db.delete(email)
+    db.commit()
+
+
+@pytest.mark.usefixtures("smtp_server")
+def test_email_worker_deletes_emails_out_of_attempts(db: Session) -> None:
+    email_to = f"reject-{random_email()}"
+    queue_email(
+        session=db,
+        email_to=email_to,
+        subject="Hello",
+        template_name="test_email.html",
+        context={"project_name": "Project", "email": email_to},
+    )
+    db.commit()
+
+    with patch("app.core.config.settings.EMAIL_MAX_ATTEMPTS", 1):
+        run(once=True)
+
+    statement = select(OutboxEmail).where(OutboxEmail.email_to == email_to)
+    assert db.exec(statement).all() == []
+
+
+def test_retry_delay_backs_off_exponentially() -> None:
+    assert retry_delay(1) == timedelta(seconds=30)
+    assert retry_delay(2) == timedelta(seconds=60)
+    assert retry_delay(20) == timedelta(hours=1)
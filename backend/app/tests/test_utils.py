@@ -0,0 +1,62 @@
+import re
+from pathlib import Path
+from unittest.mock import patch
+
+from jinja2 import Template
+from sqlmodel import Session
+
+from app.models import OutboxEmail
+from app.utils import (
+    email_templates,
+    preload_email_templates,
+    queue_reset_password_email,
+    render_email_template,
+    render_email_templates,
+    render_outbox_email,
+    verify_password_reset_token,
+)
+
+
+def test_render_email_template_matches_template_file() -> None:
+    context = {"project_name": "Project", "email": "user@example.com"}
+    template_path = Path(email_templates.loader.searchpath[0]) / "test_email.html"  # type: ignore[union-attr]
+    expected = Template(template_path.read_text()).render(context)
+    assert render_email_template(template_name="test_email.html", context=context) == (
+        expected
+    )
+
+
+def test_email_templates_are_compiled_once() -> None:
+    preload_email_templates()
+    template = email_templates.get_template("reset_password.html")
+    assert email_templates.get_template("reset_password.html") is template
+
+
+def test_render_email_templates_batch() -> None:
+    contexts = [
+        {"project_name": "Project", "email": f"user{i}@example.com"} for i in range(3)
+    ]
+    html_contents = render_email_templates(
+        template_name="test_email.html", contexts=contexts
+    )
+    assert html_contents == [
+        render_email_template(template_name="test_email.html", context=context)
+        for context in contexts
+    ]
+    assert "user2@example.com" in html_contents[2]
+
+
+def test_render_reset_password_email_creates_token(db: Session) -> None:
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
+        patch("app.core.config.settings.EMAILS_FROM_EMAIL", "admin@example.com"),
+    ):
+        queue_reset_password_email(
+            session=db, email_to="user@example.com", email="user@example.com"
+        )
+    email = next(obj for obj in db.new if isinstance(obj, OutboxEmail))
+    # The outbox only holds what's needed to render the email later
+    assert "token" not in str(email.context)
+    match = re.search(r"reset-password\?token=([\w.-]+)", render_outbox_email(email))
+    assert match
+    assert verify_password_reset_token(match.group(1)) == "user@example.com"
@@ -0,0 +1,90 @@
+import socketserver
+import threading
+from collections.abc import Generator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ReceivedEmail:
+    mail_from: str
+    rcpt_to: list[str]
+    data: str
+
+
+@dataclass
+class SMTPStandIn:
+    """
+    Minimal local SMTP server recording the emails it receives, recipients
+    containing "reject" are refused.
+    """
+
+    host: str
+    port: int
+    received: list[ReceivedEmail] = field(default_factory=list)
+    connections: int = 0
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    server: "SMTPServer"
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        stand_in = self.server.stand_in
+        stand_in.connections += 1
+        mail_from, rcpt_to = "", list[str]()
+        self.reply("220 localhost SMTP stand-in")
+        for raw in self.rfile:
+            command = raw.decode().rstrip("\r\n")
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = command.split(":", 1)[1].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip(" <>")
+                if "reject" in address:
+                    self.reply("550 Mailbox unavailable")
+                    continue
+                rcpt_to.append(address)
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data_line.decode())
+                stand_in.received.append(
+                    ReceivedEmail(
+                        mail_from=mail_from, rcpt_to=rcpt_to, data="".join(lines)
+                    )
+                )
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    stand_in: SMTPStandIn
+
+
+@contextmanager
+def smtp_stand_in() -> Generator[SMTPStandIn, None, None]:
+    with SMTPServer(("127.0.0.1", 0), SMTPHandler) as server:
+        host, port = server.server_address[:2]
+        server.stand_in = SMTPStandIn(host=str(host), port=int(port))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server.stand_in
+        finally:
+            server.shutdown()
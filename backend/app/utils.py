@@ -1,4 +1,5 @@
 import logging
+from collections.abc import Iterable
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -6,11 +7,14 @@ from typing import Any
 
 import emails  # type: ignore
 import jwt
-from jinja2 import Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from jwt.exceptions import InvalidTokenError
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
 from app.core.config import settings
+from app.models import OutboxEmail
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,27 +26,40 @@ class EmailData:
     subject: str
 
 
+# Templates are compiled once and kept in memory, the compiled code is also
+# cached on disk so that new worker processes skip the compilation
+email_templates = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "email-templates" / "build"),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=False,
+)
+
+
+def preload_email_templates() -> None:
+    for template_name in email_templates.list_templates():
+        email_templates.get_template(template_name)
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
+    html_content = email_templates.get_template(template_name).render(context)
     return html_content
 
 
-def send_email(
-    *,
-    email_to: str,
-    subject: str = "",
-    html_content: str = "",
-) -> None:
-    assert settings.emails_enabled, "no provided configuration for email variables"
-    message = emails.Message(
-        subject=subject,
-        html=html_content,
-        mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
-    )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
+def render_email_templates(
+    *, template_name: str, contexts: Iterable[dict[str, Any]]
+) -> list[str]:
+    """
+    Render a template for many recipients, e.g. for bulk sends.
+    """
+    template = email_templates.get_template(template_name)
+    return [template.render(context) for context in contexts]
+
+
+def get_smtp_options() -> dict[str, Any]:
+    smtp_options: dict[str, Any] = {
+        "host": settings.SMTP_HOST,
+        "port": settings.SMTP_PORT,
+    }
     if settings.SMTP_TLS:
         smtp_options["tls"] = True
     elif settings.SMTP_SSL:
@@ -51,10 +68,64 @@ def send_email(
         smtp_options["user"] = settings.SMTP_USER
     if settings.SMTP_PASSWORD:
         smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
+    return smtp_options
+
+
+def build_email_message(*, subject: str, html_content: str) -> Any:
+    return emails.Message(
+        subject=subject,
+        html=html_content,
+        mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
+    )
+
+
+def send_email(
+    *,
+    email_to: str,
+    subject: str = "",
+    html_content: str = "",
+) -> None:
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    message = build_email_message(subject=subject, html_content=html_content)
+    response = message.send(to=email_to, smtp=get_smtp_options())
     logger.info(f"send email result: {response}")
 
 
+def queue_email(
+    *,
+    session: Session | AsyncSession,
+    email_to: str,
+    subject: str,
+    template_name: str,
+    context: dict[str, Any],
+) -> None:
+    """
+    Add an email to the outbox, it's sent by the email worker once the session
+    is committed, so it's only sent if the rest of the transaction is.
+
+    The outbox keeps the template and its context until the email is sent, the
+    context must not hold secrets like passwords or reset tokens.
+    """
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    session.add(
+        OutboxEmail(
+            email_to=email_to,
+            subject=subject,
+            template_name=template_name,
+            context=context,
+        )
+    )
+
+
+def render_outbox_email(email: OutboxEmail) -> str:
+    # Password reset tokens are created as the email is sent, not stored
+    context = dict(email.context)
+    if email.template_name == "reset_password.html":
+        token = generate_password_reset_token(email=context["username"])
+        context["link"] = get_password_reset_link(token)
+    return render_email_template(template_name=email.template_name, context=context)
+
+
 def generate_test_email(email_to: str) -> EmailData:
     project_name = settings.PROJECT_NAME
     subject = f"{project_name} - Test email"
@@ -65,39 +136,65 @@ def generate_test_email(email_to: str) -> EmailData:
     return EmailData(html_content=html_content, subject=subject)
 
 
+def get_password_reset_link(token: str) -> str:
+    return f"{settings.FRONTEND_HOST}/reset-password?token={token}"
+
+
+def get_reset_password_email_context(email_to: str, email: str) -> dict[str, Any]:
+    # Without the link to reset the password, it holds a reset token
+    return {
+        "project_name": settings.PROJECT_NAME,
+        "username": email,
+        "email": email_to,
+        "valid_hours": settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS,
+    }
+
+
+def get_reset_password_email_subject(email: str) -> str:
+    return f"{settings.PROJECT_NAME} - Password recovery for user {email}"
+
+
 def generate_reset_password_email(email_to: str, email: str, token: str) -> EmailData:
-    project_name = settings.PROJECT_NAME
-    subject = f"{project_name} - Password recovery for user {email}"
-    link = f"{settings.FRONTEND_HOST}/reset-password?token={token}"
     html_content = render_email_template(
         template_name="reset_password.html",
         context={
-            "project_name": settings.PROJECT_NAME,
-            "username": email,
-            "email": email_to,
-            "valid_hours": settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS,
-            "link": link,
+            **get_reset_password_email_context(email_to=email_to, email=email),
+            "link": get_password_reset_link(token),
         },
     )
-    return EmailData(html_content=html_content, subject=subject)
+    return EmailData(
+        html_content=html_content, subject=get_reset_password_email_subject(email)
+    )
 
 
-def generate_new_account_email(
-    email_to: str, username: str, password: str
-) -> EmailData:
-    project_name = settings.PROJECT_NAME
-    subject = f"{project_name} - New account for user {username}"
-    html_content = render_email_template(
+def queue_reset_password_email(
+    *, session: Session | AsyncSession, email_to: str, email: str
+) -> None:
+    queue_email(
+        session=session,
+        email_to=email_to,
+        subject=get_reset_password_email_subject(email),
+        template_name="reset_password.html",
+        context=get_reset_password_email_context(email_to=email_to, email=email),
+    )
+
+
+def queue_new_account_email(
+    *, session: Session | AsyncSession, email_to: str, username: str
+) -> None:
+    # The password is not sent, the user got it from whoever created the account
+    queue_email(
+        session=session,
+        email_to=email_to,
+        subject=f"{settings.PROJECT_NAME} - New account for user {username}",
         template_name="new_account.html",
         context={
             "project_name": settings.PROJECT_NAME,
             "username": username,
-            "password": password,
             "email": email_to,
             "link": settings.FRONTEND_HOST,
         },
     )
-    return EmailData(html_content=html_content, subject=subject)
 
 
 def generate_password_reset_token(email: str) -> str:
@@ -115,9 +212,7 @@ def generate_password_reset_token(email: str) -> str:
 
 def verify_password_reset_token(token: str) -> str | None:
     try:
-        decoded_token = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
+        decoded_token = security.decode_token(token)
         return str(decoded_token["sub"])
     except InvalidTokenError:
         return None
@@ -0,0 +1,14 @@
+#! /usr/bin/env bash
+
+set -e
+set -x
+
+# Metrics files left by the workers of a previous run must not be aggregated
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# The client IPs forwarded by the proxies listed in FORWARDED_ALLOW_IPS are used
+# as the request client, the rate limits by IP need them
+exec fastapi run --workers 4 --proxy-headers app/main.py